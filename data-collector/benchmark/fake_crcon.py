@@ -0,0 +1,72 @@
+import asyncio
+import random
+import threading
+import time
+
+from aiohttp import web
+
+MAPS = ["stmereeglise", "carentan", "foy", "hurtgenforest"]
+MATCH_TIME = 5400
+
+
+# serves get_gamestate/get_status for any number of CRCON instances below /<instance>/api/
+class FakeCrcon:
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.connections = set()
+        self.started: dict[str, tuple[float, int]] = {}
+        self.loop = asyncio.new_event_loop()
+
+    def base_url(self, instance: str) -> str:
+        return f"http://{self.host}:{self.port}/{instance}/api"
+
+    async def _endpoint(self, request: web.Request):
+        self.requests += 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        await asyncio.sleep(self.latency)
+
+        if random.random() < self.failure_rate:
+            return web.json_response({"failed": True, "error": "fake failure", "result": None})
+
+        # every instance starts at a random point of the rotation and plays the maps in order
+        instance = request.match_info["instance"]
+        started, first_map = self.started.setdefault(instance, (time.time() - random.uniform(0, MATCH_TIME), random.randrange(len(MAPS))))
+        elapsed = time.time() - started
+        layer = {"id": f"{MAPS[(first_map + int(elapsed // MATCH_TIME)) % len(MAPS)]}_warfare", "game_mode": "warfare"}
+        layer["map"] = {"id": layer["id"].removesuffix("_warfare")}
+
+        endpoint = request.match_info["endpoint"]
+        if endpoint == "get_status":
+            return web.json_response({"failed": False, "result": {"current_players": random.randint(0, 100), "map": layer}})
+        if endpoint == "get_gamestate":
+            return web.json_response({"failed": False, "result": {
+                "match_time": MATCH_TIME,
+                "time_remaining": MATCH_TIME - elapsed % MATCH_TIME,
+                "current_map": layer,
+                "allied_score": random.randint(0, 5),
+                "axis_score": random.randint(0, 5),
+                "num_allied_players": random.randint(0, 50),
+                "num_axis_players": random.randint(0, 50),
+            }})
+        if endpoint == "get_map_rotation":
+            return web.json_response({"failed": False, "result": [{"id": f"{name}_warfare"} for name in MAPS]})
+
+        raise web.HTTPNotFound()
+
+    async def _start(self):
+        app = web.Application()
+        app.add_routes([web.get("/{instance}/api/{endpoint}", self._endpoint)])
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port, backlog=4096)
+        await site.start()
+        self.port = runner.addresses[0][1]
+
+    def start(self) -> "FakeCrcon":
+        threading.Thread(target=self.loop.run_forever, name="fake-crcon", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
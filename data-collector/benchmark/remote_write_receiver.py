@@ -0,0 +1,87 @@
+import argparse
+import struct
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from aiohttp import web
+
+from remote_write import snappy_decompress
+
+
+def _varint(data: bytes, position: int) -> tuple[int, int]:
+    value, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def _fields(data: bytes):
+    position = 0
+    while position < len(data):
+        tag, position = _varint(data, position)
+        field, wire_type = tag >> 3, tag & 0x07
+        if wire_type == 0:
+            value, position = _varint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            length, position = _varint(data, position)
+            value, position = data[position:position + length], position + length
+        else:
+            raise ValueError(f"unsupported wire type {wire_type}")
+        yield field, value
+
+
+def decode_write_request(data: bytes) -> list[tuple[dict[str, str], list[tuple[float, int]]]]:
+    series = []
+    for _, timeseries in _fields(data):
+        labels, samples = {}, []
+        for field, value in _fields(timeseries):
+            if field == 1:
+                label = dict(_fields(value))
+                labels[label[1].decode()] = label[2].decode()
+            elif field == 2:
+                sample = dict(_fields(value))
+                samples.append((struct.unpack("<d", sample[1])[0], sample.get(2, 0)))
+        series.append((labels, samples))
+    return series
+
+
+# stand-in for the remote-write endpoint of Prometheus, prints every received sample
+class Receiver:
+    def __init__(self, fail: int = 0):
+        self.fail = fail
+        self.samples = []
+
+    async def write(self, request: web.Request):
+        if self.fail:
+            self.fail -= 1
+            raise web.HTTPServiceUnavailable()
+
+        for labels, samples in decode_write_request(snappy_decompress(await request.read())):
+            name = labels.pop("__name__")
+            for value, timestamp in samples:
+                self.samples.append((name, labels, value, timestamp))
+                print(f"{name}{labels} {value} @{timestamp}")
+        return web.Response(status=204)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for a Prometheus remote-write receiver")
+    parser.add_argument("--port", type=int, default=9201)
+    parser.add_argument("--fail", type=int, default=0, help="answer the first N requests with 503")
+    args = parser.parse_args()
+
+    app = web.Application()
+    app.add_routes([web.post("/api/v1/write", Receiver(args.fail).write)])
+    web.run_app(app, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
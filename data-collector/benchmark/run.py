@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import wait
+from pathlib import Path
+
+BENCHMARK_PATH = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARK_PATH.parent / "src"))
+
+import psutil
+import yaml
+from aiohttp.test_utils import TestClient, TestServer
+
+from shared.config import Config
+from shared.cache import ResultCache
+import collector
+import publisher
+from resolver import icmp
+from fake_crcon import FakeCrcon
+
+
+class TimedCollector(collector.DataCollector):
+    def __init__(self, config: Config, cache: ResultCache):
+        super().__init__(config, cache)
+        self.durations: dict[str, list[float]] = {}
+
+    def _resolve(self, server, resolver):
+        started = time.perf_counter()
+        super()._resolve(server, resolver)
+        self.durations.setdefault(resolver.resolver_id, []).append(time.perf_counter() - started)
+
+    def run_pass(self) -> float:
+        # every job due at once, the worst case the scheduler's phase spreading avoids
+        started = time.perf_counter()
+        wait([
+            self._executor(resolver.resolver_id).submit(self._resolve, server, resolver)
+            for server in self.config.servers
+            for resolver in server.resolvers
+        ])
+        return time.perf_counter() - started
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(percent) - 1]
+
+
+def write_config(path: str, servers: int, crcon: FakeCrcon, args) -> str:
+    config = {
+        "global": {
+            "run_interval_seconds": 10,
+            "max_workers": args.max_workers,
+            "resolvers": {
+                "network": {"packets": args.ping_packets, "interval": args.ping_interval, "timeout": 2.0},
+                "network-traceroute": {
+                    "engine": args.traceroute_engine,
+                    "max_concurrency": args.mtr_concurrency,
+                    "storage_path": os.path.join(path, "traceroutes"),
+                },
+            },
+        },
+        "servers": [
+            {
+                "hostname": f"127.{(n >> 16) & 0xFF}.{(n >> 8) & 0xFF}.{n & 0xFF}",
+                "resolvers": {"hll-crcon": {"api_key": "benchmark", "base_url": crcon.base_url(f"server-{n}")}},
+            }
+            for n in range(1, servers + 1)
+        ],
+    }
+
+    config_path = os.path.join(path, f"config-{servers}.yml")
+    with open(config_path, "w") as f:
+        yaml.safe_dump(config, f)
+    return config_path
+
+
+async def scrape(app, count: int) -> tuple[list[float], int, int]:
+    durations = []
+    async with TestClient(TestServer(app)) as client:
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get("/metrics", headers={"Accept-Encoding": "identity"})
+            plain = await response.read()
+            durations.append(time.perf_counter() - started)
+
+        response = await client.get("/metrics", headers={"Accept-Encoding": "gzip"}, auto_decompress=False)
+        compressed = await response.read()
+
+    return durations, len(plain), len(compressed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data-collector against local fakes of CRCON, ping and mtr")
+    parser.add_argument("--servers", default="1,10,100,1000", help="comma separated server counts to sweep")
+    parser.add_argument("--passes", type=int, default=2, help="collection passes per server count, the last one is reported")
+    parser.add_argument("--scrapes", type=int, default=20)
+    parser.add_argument("--max-workers", type=int, default=64)
+    parser.add_argument("--mtr-concurrency", type=int, default=16)
+    parser.add_argument("--mtr-latency", type=float, default=0.5)
+    parser.add_argument("--traceroute-engine", choices=("native", "mtr"), default="native")
+    parser.add_argument("--hops", type=int, default=8, help="path length of the native traceroute fake")
+    parser.add_argument("--ping-latency", type=float, default=0.02)
+    parser.add_argument("--ping-loss", type=float, default=0.0)
+    parser.add_argument("--ping-packets", type=int, default=10)
+    parser.add_argument("--ping-interval", type=float, default=0.1)
+    parser.add_argument("--crcon-latency", type=float, default=0.05)
+    parser.add_argument("--crcon-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+    os.environ["PATH"] = f"{BENCHMARK_PATH / 'bin'}{os.pathsep}{os.environ['PATH']}"
+    os.environ["FAKE_MTR_LATENCY"] = str(args.mtr_latency)
+    icmp.shared_engine = icmp.IcmpEngine(lambda: icmp.LoopbackIcmpSocket(args.ping_latency, args.ping_loss, args.hops))
+    crcon = FakeCrcon(args.crcon_latency, args.crcon_failure_rate).start()
+    process = psutil.Process()
+
+    print(f"{'servers':>8} {'cycle s':>8} {'network p50/p95/p99 ms':>24} {'traceroute p50/p95/p99 ms':>26} "
+          f"{'crcon p50/p95/p99 ms':>22} {'scrape p50/max ms':>18} {'payload kB':>11} {'gzip kB':>8} {'rss MB':>7}")
+
+    with tempfile.TemporaryDirectory() as path:
+        for servers in (int(count) for count in args.servers.split(",")):
+            config = Config(write_config(path, servers, crcon, args))
+            cache = ResultCache()
+            timed = TimedCollector(config, cache)
+
+            for _ in range(args.passes):
+                timed.durations = {}
+                cycle = timed.run_pass()
+
+            metrics = publisher.Publisher(config, cache)
+            durations, plain, compressed = asyncio.run(scrape(metrics.app, args.scrapes))
+
+            def latencies(resolver_id: str) -> str:
+                values = [duration * 1000 for duration in timed.durations.get(resolver_id, [])]
+                return "/".join(f"{percentile(values, p):.0f}" for p in (50, 95, 99))
+
+            print(f"{servers:>8} {cycle:>8.2f} {latencies('network'):>24} {latencies('network-traceroute'):>26} "
+                  f"{latencies('hll-crcon'):>22} "
+                  f"{f'{percentile(durations, 50) * 1000:.1f}/{max(durations) * 1000:.1f}':>18} "
+                  f"{plain / 1024:>11.1f} {compressed / 1024:>8.1f} {process.memory_info().rss / 2 ** 20:>7.1f}")
+
+            for executor in timed.executors.values():
+                executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import random
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+
+
+# stops running a resolver against a server that keeps failing, and probes it again with an increasing backoff
+class CircuitBreaker:
+    def __init__(self, threshold: int, backoff: float, max_backoff: float):
+        self.threshold = threshold
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.backoff = backoff
+        self.failures = 0
+        self.state = CLOSED
+        self.open_until = 0.0
+
+    def allow(self, current: float) -> bool:
+        if self.state == OPEN and current >= self.open_until:
+            self.state = HALF_OPEN
+        return self.state != OPEN
+
+    def success(self) -> bool:
+        recovered = self.state != CLOSED
+        self.failures = 0
+        self.state = CLOSED
+        self.backoff = self.base_backoff
+        return recovered
+
+    def failure(self, current: float) -> bool:
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        elif self.failures < self.threshold:
+            return False
+
+        # a little jitter, so servers that failed together are not probed together
+        self.state = OPEN
+        self.open_until = current + self.backoff * random.uniform(0.9, 1.1)
+        return True
@@ -1,36 +1,266 @@
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from prometheus_client import Counter, Gauge, Histogram
+
+import breaker
+from resolver import dns
+from resolver.schema import check
 from resolver.run_results import Result, SkippedRun
+from scheduler import Job, Scheduler
 from shared.cache import ResultCache
-from shared.config import Config
+from shared.config import Config, Server
 from shared.shared import logger
 
 logger = logger('collector')
 
+RUN_DURATION = Histogram(
+    "collector_resolver_run_duration_seconds",
+    "Duration of a single resolver run",
+    ["resolver_id"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+RUNS = Counter(
+    "collector_resolver_runs",
+    "Resolver runs by outcome (success, exception, skipped, circuit_open)",
+    ["resolver_id", "outcome"],
+)
+OVERRUNS = Counter(
+    "collector_resolver_overruns",
+    "Scheduled runs dropped because the previous run of the same server and resolver was still in progress",
+    ["resolver_id"],
+)
+CYCLE_DURATION = Histogram(
+    "collector_cycle_duration_seconds",
+    "Time between two completed runs of the same server and resolver",
+    ["resolver_id"],
+    buckets=(1, 5, 10, 15, 30, 60, 90, 120, 300, 600),
+)
+CIRCUIT_STATE = Gauge(
+    "collector_circuit_state",
+    "Circuit breaker per server and resolver (0 closed, 1 open, 2 half-open)",
+    ["server_id", "resolver_id"],
+    multiprocess_mode="mostrecent",
+)
+CYCLE_LAG = Histogram(
+    "collector_cycle_lag_seconds",
+    "Delay between the scheduled and the actual start of a resolver run",
+    ["resolver_id"],
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
 
 class DataCollector:
     def __init__(self, config: Config, cache: ResultCache):
         self.cache = cache
         self.config = config
+        self.workers = threading.BoundedSemaphore(config.max_workers)
+        self.executors: dict[str, ThreadPoolExecutor] = {}
+        self.scheduler = Scheduler()
+        self.completed: dict[tuple[str, str], float] = {}
+        self.jobs: dict[tuple[str, str], Job] = {}
+        # serializes the cache updates of running jobs with their removal on reload
+        self.removing = threading.Lock()
+        # circuits exported in CIRCUIT_STATE, closed ones are not
+        self.open_circuits: set[tuple[str, str]] = set()
+        self.config_mtime = self._config_mtime()
+        self.next_reload = 0.0
+        dns.configure(**config.dns)
+
+    def _executor(self, resolver_id: str) -> ThreadPoolExecutor:
+        if resolver_id not in self.executors:
+            max_concurrency = self.config.resolver_settings(resolver_id).get('max_concurrency', self.config.max_workers)
+            self.executors[resolver_id] = ThreadPoolExecutor(
+                max_workers=max(1, min(max_concurrency, self.config.max_workers)),
+                thread_name_prefix=f'resolver-{resolver_id}',
+            )
+        return self.executors[resolver_id]
+
+    def _resolve(self, server: Server, resolver, due: float | None = None, job: Job | None = None):
+        circuit = job.breaker if job is not None else None
+        with self.workers:
+            started = time.monotonic()
+            if due is not None:
+                CYCLE_LAG.labels(resolver.resolver_id).observe(max(0.0, started - due))
+
+            outcome = "exception"
+            try:
+                result = resolver.run(server, self.cache.get(server.hostname, resolver.resolver_id))
+
+                if isinstance(result, Result):
+                    check(resolver.resolver_id, resolver.schema, result.metrics)
+                    with self.removing:
+                        # removed by a reload while running, the result must not bring the server back
+                        if job is None or job.key in self.jobs:
+                            self.cache.update(server.hostname, resolver.resolver_id, result)
+                    outcome = "success"
+                elif isinstance(result, SkippedRun):
+                    logger.debug("Skipped %s run for %s: %s", resolver.resolver_id, server.hostname, result.reason)
+                    outcome = "skipped"
+                else:
+                    raise ValueError("resolver response has to be of type Result|SkippedRun")
+            except BaseException as exception:
+                extra = {"server_id": server.hostname, "resolver_id": resolver.resolver_id}
+                if circuit is None or not circuit.failures:
+                    resolver.logger.exception(exception, extra=extra)
+                else:
+                    # the stack trace was logged on the first failure already
+                    resolver.logger.warning(f"{server.hostname} failed again ({circuit.failures + 1} in a row): {exception!r}", extra=extra)
+            finally:
+                finished = time.monotonic()
+                RUN_DURATION.labels(resolver.resolver_id).observe(finished - started)
+                RUNS.labels(resolver.resolver_id, outcome).inc()
+
+                if circuit is not None and outcome != "skipped" and not job.cancelled:
+                    self._record(server, resolver, circuit, outcome == "success")
+
+                key = (server.hostname, resolver.resolver_id)
+                if outcome == "success":
+                    if key in self.completed:
+                        CYCLE_DURATION.labels(resolver.resolver_id).observe(finished - self.completed[key])
+                    self.completed[key] = finished
+
+    def _record(self, server: Server, resolver, circuit: breaker.CircuitBreaker, success: bool):
+        extra = {"server_id": server.hostname, "resolver_id": resolver.resolver_id}
+        if success:
+            if circuit.success():
+                logger.info(f"{resolver.resolver_id} for {server.hostname} recovered, circuit closed", extra=extra)
+        elif circuit.failure(time.monotonic()):
+            logger.warning(f"{resolver.resolver_id} for {server.hostname} failed {circuit.failures} times in a row, "
+                           f"circuit open for {circuit.backoff:.0f}s", extra=extra)
+        self._export_circuit((server.hostname, resolver.resolver_id), circuit.state)
+
+    def _export_circuit(self, key: tuple[str, str], state: int):
+        if state != breaker.CLOSED:
+            CIRCUIT_STATE.labels(*key).set(state)
+            self.open_circuits.add(key)
+        elif key in self.open_circuits:
+            self.open_circuits.discard(key)
+            if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+                # the collector processes record into files, their series cannot be removed
+                CIRCUIT_STATE.labels(*key).set(state)
+            else:
+                CIRCUIT_STATE.remove(*key)
+
+    def _allow(self, job: Job) -> bool:
+        state = job.breaker.state
+        allowed = job.breaker.allow(time.monotonic())
+        if job.breaker.state != state:
+            self._export_circuit(job.key, job.breaker.state)
+        return allowed
+
+    def _first_due(self, job: Job) -> float | None:
+        # continue where a restored result left off instead of probing everything right after a restart
+        last_result = self.cache.get(*job.key)
+        if last_result is None:
+            return None
+
+        remaining = last_result.timestamp.timestamp() + job.interval - time.time()
+        return time.monotonic() + remaining if remaining > 0 else None
+
+    def _add(self, server: Server, resolver, future=None):
+        job = Job(server, resolver, self.config.resolver_interval(resolver))
+        job.future = future
+        settings = self.config.circuit_breaker
+        if settings:
+            job.breaker = breaker.CircuitBreaker(settings["failures"], settings["backoff_seconds"], settings["max_backoff_seconds"])
+            self._export_circuit(job.key, breaker.CLOSED)
+        self.jobs[job.key] = job
+        self.scheduler.add(job, self._first_due(job))
+
+    def _config_mtime(self) -> int | None:
+        try:
+            return os.stat(self.config.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload(self):
+        mtime = self._config_mtime()
+        if mtime is None or mtime == self.config_mtime:
+            return
+        self.config_mtime = mtime
+
+        try:
+            config = Config(self.config.path, self.config.worker)
+            servers = config.servers
+        except Exception as exception:
+            logger.error(f"keeping the running configuration, reloading '{self.config.path}' failed: {exception}")
+            return
+
+        previous, self.config = self.config, config
+        wanted = {(server.hostname, resolver.resolver_id): (server, resolver) for server in servers for resolver in server.resolvers}
+        added, changed, removed = 0, 0, 0
+
+        for key, job in list(self.jobs.items()):
+            if key not in wanted:
+                with self.removing:
+                    job.cancelled = True
+                    del self.jobs[key]
+                    self.cache.remove(*key)
+                self.completed.pop(key, None)
+                self._export_circuit(key, breaker.CLOSED)
+                removed += 1
+
+        # unchanged jobs keep their resolver, its state and the result they are working on
+        for key, (server, resolver) in wanted.items():
+            job = self.jobs.get(key)
+            if job is None:
+                self._add(server, resolver)
+                added += 1
+            elif job.resolver.config != resolver.config or job.interval != config.resolver_interval(resolver):
+                job.cancelled = True
+                self._add(server, resolver, job.future)
+                changed += 1
+
+        if config.max_workers != previous.max_workers:
+            # runs in progress release the semaphore they acquired
+            self.workers = threading.BoundedSemaphore(config.max_workers)
+        for resolver_id in list(self.executors):
+            if config.max_workers != previous.max_workers or \
+                    config.resolver_settings(resolver_id).get('max_concurrency') != previous.resolver_settings(resolver_id).get('max_concurrency'):
+                self.executors.pop(resolver_id).shutdown(wait=False)
+
+        reloaded = {'resolvers', 'run_interval_seconds', 'max_workers', 'reload_interval_seconds', 'sharding'}
+        restart = sorted(
+            name for name in config.raw["global"].keys() | previous.raw["global"].keys()
+            if name not in reloaded and config.raw["global"].get(name) != previous.raw["global"].get(name)
+        )
+        if restart:
+            logger.warning(f"changes to {', '.join(restart)} take effect after a restart")
+
+        logger.info(f"reloaded '{config.path}': {added} added, {changed} changed, {removed} removed")
 
     def run(self):
+        if self.config.sharding:
+            shard, shards = self.config.sharding
+            logger.info(f"shard {shard} of {shards}, collecting {len(self.config.servers)} of {len(self.config.config.servers)} servers")
+
+        for server in self.config.servers:
+            for resolver in server.resolvers:
+                self._add(server, resolver)
+
         while True:
-            for server in self.config.servers:
-                logger.debug(f'resolving data for server "{server.hostname}"')
-                for resolver in server.resolvers:
-                    try:
-                        result = resolver.run(server, self.cache.get(server.hostname, resolver.resolver_id))
+            reload_interval = self.config.reload_interval
+            if reload_interval and time.monotonic() >= self.next_reload:
+                self.next_reload = time.monotonic() + reload_interval
+                self._reload()
 
-                        if isinstance(result, Result):
-                            self.cache.update(server.hostname, resolver.resolver_id, result)
-                        elif isinstance(result, SkippedRun):
-                            logger.debug(f"Skipped {resolver.resolver_id} run for {server.hostname}: {result.reason}")
-                        else:
-                            raise ValueError("resolver response has to be of type Result|SkippedRun")
-                    except BaseException as exception:
-                        resolver.logger.exception(exception)
-
-            time.sleep(self.config.run_interval)
+            for job in self.scheduler.wait_due(reload_interval or None):
+                # %-style arguments, the hot path does not format debug messages that are not logged
+                if job.running:
+                    logger.debug("Skipped %s run for %s: previous run still in progress", *reversed(job.key))
+                    OVERRUNS.labels(job.resolver.resolver_id).inc()
+                elif job.breaker is not None and not self._allow(job):
+                    RUNS.labels(job.resolver.resolver_id, "circuit_open").inc()
+                else:
+                    logger.debug('resolving %s for server "%s"', *reversed(job.key))
+                    job.future = self._executor(job.resolver.resolver_id).submit(
+                        self._resolve, job.server, job.resolver, job.due, job
+                    )
+
+                self.scheduler.reschedule(job)
 
 
 def invoke(config: Config, cache: ResultCache):
@@ -0,0 +1,163 @@
+import asyncio
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+
+from aiohttp import web
+
+from shared.shared import logger
+
+logger = logger('debug')
+
+MAX_PROFILE_SECONDS = 300
+# every traced allocation stores its frames, deep tracebacks multiply tracemalloc's overhead
+MAX_MEMORY_FRAMES = 64
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _stack(frame) -> list[str]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def sample(self, seconds: float, interval: float, thread_prefix: str) -> Counter:
+        stacks = Counter()
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + seconds
+
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, str(thread_id))
+                if thread_id == own_id or not name.startswith(thread_prefix):
+                    continue
+                stacks[(name, *self._stack(frame))] += 1
+            time.sleep(interval)
+
+        return stacks
+
+    @staticmethod
+    def collapsed(stacks: Counter) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+    @staticmethod
+    def top(stacks: Counter, limit: int) -> str:
+        own = Counter()
+        total = Counter()
+        for stack, count in stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack[1:]):
+                total[function] += count
+
+        samples = sum(stacks.values()) or 1
+        lines = [f"{'own%':>6} {'total%':>7} {'samples':>8}  function"]
+        for function, count in own.most_common(limit):
+            lines.append(f"{100 * count / samples:>6.1f} {100 * total[function] / samples:>7.1f} {count:>8}  {function}")
+        return "\n".join(lines) + "\n"
+
+
+class DebugRoutes:
+    def __init__(self):
+        self.profiler = SamplingProfiler()
+        self.memory_snapshot: tracemalloc.Snapshot | None = None
+
+    def register(self, app: web.Application):
+        app.add_routes([
+            web.get("/debug/profile", self._profile),
+            web.get("/debug/threads", self._threads),
+            web.post("/debug/memory/start", self._memory_start),
+            web.post("/debug/memory/stop", self._memory_stop),
+            web.get("/debug/memory", self._memory),
+        ])
+
+    async def _profile(self, request: web.Request):
+        try:
+            seconds = min(float(request.query.get("seconds", 10)), MAX_PROFILE_SECONDS)
+            interval = max(float(request.query.get("interval", 0.01)), 0.001)
+            limit = int(request.query.get("limit", 50))
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds, interval and limit have to be numbers")
+
+        output = request.query.get("format", "collapsed")
+        if output not in ("collapsed", "top"):
+            raise web.HTTPBadRequest(text="format has to be 'collapsed' or 'top'")
+
+        if not self.profiler.lock.acquire(blocking=False):
+            raise web.HTTPConflict(text="a profile is already running")
+
+        try:
+            logger.info(f"profiling threads for {seconds}s")
+            stacks = await asyncio.get_running_loop().run_in_executor(
+                None, self.profiler.sample, seconds, interval, request.query.get("threads", "")
+            )
+        finally:
+            self.profiler.lock.release()
+
+        if output == "top":
+            return web.Response(text=self.profiler.top(stacks, limit))
+        return web.Response(text=self.profiler.collapsed(stacks))
+
+    async def _threads(self, request: web.Request):
+        names = {thread.ident: thread for thread in threading.enumerate()}
+        dump = []
+        for thread_id, frame in sys._current_frames().items():
+            thread = names.get(thread_id)
+            name = thread.name if thread else str(thread_id)
+            daemon = " daemon" if thread and thread.daemon else ""
+            dump.append(f'Thread "{name}" ({thread_id}){daemon}:\n{"".join(traceback.format_stack(frame))}')
+        return web.Response(text="\n".join(dump))
+
+    async def _memory_start(self, request: web.Request):
+        if tracemalloc.is_tracing():
+            return web.Response(text="tracemalloc is already tracing\n")
+
+        try:
+            frames = min(max(int(request.query.get("frames", 1)), 1), MAX_MEMORY_FRAMES)
+        except ValueError:
+            raise web.HTTPBadRequest(text="frames has to be a number")
+
+        tracemalloc.start(frames)
+        self.memory_snapshot = None
+        return web.Response(text="tracemalloc started\n")
+
+    async def _memory_stop(self, request: web.Request):
+        tracemalloc.stop()
+        self.memory_snapshot = None
+        return web.Response(text="tracemalloc stopped\n")
+
+    async def _memory(self, request: web.Request):
+        if not tracemalloc.is_tracing():
+            raise web.HTTPConflict(text="tracemalloc is not tracing, POST /debug/memory/start first")
+
+        try:
+            limit = int(request.query.get("limit", 25))
+        except ValueError:
+            raise web.HTTPBadRequest(text="limit has to be a number")
+        key_type = request.query.get("group", "lineno")
+        if key_type not in ("lineno", "filename", "traceback"):
+            raise web.HTTPBadRequest(text="group has to be 'lineno', 'filename' or 'traceback'")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced: {current / 2 ** 20:.1f} MiB, peak: {peak / 2 ** 20:.1f} MiB", "", "top allocations:"]
+        lines += [str(stat) for stat in snapshot.statistics(key_type)[:limit]]
+
+        if self.memory_snapshot is not None:
+            lines += ["", "difference to the previous snapshot:"]
+            lines += [str(stat) for stat in snapshot.compare_to(self.memory_snapshot, key_type)[:limit]]
+
+        self.memory_snapshot = snapshot
+        return web.Response(text="\n".join(lines) + "\n")
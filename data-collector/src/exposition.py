@@ -0,0 +1,178 @@
+import functools
+import heapq
+import re
+import time
+import zlib
+from datetime import timezone
+
+from prometheus_client import Counter
+from prometheus_client.utils import floatToGoString
+
+from resolver.resolver import Resolver
+from resolver.run_results import Result
+from shared.cache import ResultCache, LabeledMetric
+
+INVALID_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+SERIES_OVERFLOW = Counter(
+    "publisher_series_overflow",
+    "Series dropped from the exposition because their metric reached max_series_per_metric",
+    ["metric"],
+)
+
+
+@functools.lru_cache(maxsize=None)
+def sanitize_name(name: str) -> str:
+    sanitized = INVALID_NAME_CHARS.sub("_", name)
+    return f"_{sanitized}" if sanitized[0].isdigit() else sanitized
+
+
+def label_name(name: str, value: LabeledMetric) -> str:
+    # results without an explicit label name, e.g. restored from the checkpoint of an older version
+    return sanitize_name(value.label_name or f"{name}_label")
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _header(name: str, help_text: str, metric_type: str = "gauge") -> bytes:
+    sanitized = sanitize_name(name)
+    return f"# HELP {sanitized} {help_text}\n# TYPE {sanitized} {metric_type}\n".encode()
+
+
+def schema_headers() -> dict[str, bytes]:
+    # rendered once from the declared schemas instead of per family and render
+    headers = {}
+    for resolver_id, resolver in Resolver._registry.items():
+        headers[f"{resolver_id}_timestamp"] = _header(f"{resolver_id}_timestamp", "Time of the latest result (unix seconds)")
+        for metric, declaration in resolver.schema.items():
+            headers[f"{resolver_id}_{metric}"] = _header(f"{resolver_id}_{metric}", declaration.help_text(), declaration.type)
+    return headers
+
+
+class ExpositionCache:
+    def __init__(self, ttl: float | None = None, max_series: int | None = None):
+        self.ttl = ttl
+        self.max_series = max_series
+        self.generation = -1
+        self.blocks: dict[tuple[str, str], dict[str, list[str]]] = {}
+        self.families: dict[str, dict[tuple[str, str], list[str]]] = {}
+        self.series: dict[str, int] = {}
+        self.expiry: list[tuple[float, tuple[str, str]]] = []
+        self.expires: dict[tuple[str, str], float] = {}
+        self.chunks: dict[str, bytes] = {}
+        self.body = b""
+        # gzip output of the body so far, the compressor is copied to append the self-instrumentation per scrape
+        self.gzipped: bytes | None = None
+        self.compressor = None
+        self.headers = schema_headers()
+
+    def _name(self, name: str) -> str:
+        return sanitize_name(name)
+
+    def _sample(self, name: str, server_label: str, value) -> str:
+        if isinstance(value, LabeledMetric):
+            label_value = escape_label_value(str(value.label))
+            return f'{self._name(name)}{{{server_label},{label_name(name, value)}="{label_value}"}} {floatToGoString(value.value)}\n'
+
+        return f'{self._name(name)}{{{server_label}}} {floatToGoString(value)}\n'
+
+    def _render_block(self, server_id: str, resolver_id: str, result: Result) -> dict[str, list[str]]:
+        server_label = f'server_id="{escape_label_value(server_id)}"'
+        timestamp_name = f"{resolver_id}_timestamp"
+        samples = {
+            timestamp_name: [self._sample(timestamp_name, server_label, result.timestamp.astimezone(timezone.utc).timestamp())]
+        }
+
+        for metric, value in result.metrics.items():
+            name = f"{resolver_id}_{metric}"
+            values = value if isinstance(value, (list, tuple)) else (value,)
+            samples[name] = [self._sample(name, server_label, v) for v in values]
+
+        return samples
+
+    def _set_block(self, key: tuple[str, str], samples: dict[str, list[str]], dirty: set[str]):
+        previous = self.blocks.pop(key, {})
+        for name in previous.keys() - samples.keys():
+            self.series[name] -= len(self.families[name].pop(key))
+            dirty.add(name)
+
+        for name, lines in samples.items():
+            family = self.families.setdefault(name, {})
+            series = self.series.get(name, 0) - len(family.get(key, ()))
+
+            if self.max_series is not None and series + len(lines) > self.max_series:
+                allowed = max(0, self.max_series - series)
+                SERIES_OVERFLOW.labels(metric=self._name(name)).inc(len(lines) - allowed)
+                lines = lines[:allowed]
+
+            family[key] = lines
+            self.series[name] = series + len(lines)
+            dirty.add(name)
+
+        if samples:
+            self.blocks[key] = samples
+
+    def _expire(self, current: float, dirty: set[str]):
+        while self.expiry and self.expiry[0][0] <= current:
+            expires, key = heapq.heappop(self.expiry)
+            if self.expires.get(key) == expires:
+                del self.expires[key]
+                self._set_block(key, {}, dirty)
+
+    def _family_text(self, name: str, lines: list[str]) -> bytes:
+        header = self.headers.get(name)
+        if header is None:
+            # undeclared, e.g. restored from the checkpoint of an older version
+            header = self.headers[name] = _header(name, name)
+        return header + "".join(lines).encode()
+
+    def _render_family(self, name: str) -> bytes:
+        return self._family_text(name, [line for block_lines in self.families[name].values() for line in block_lines])
+
+    def render_result(self, server_id: str, resolver_id: str, result: Result) -> bytes:
+        # a single result on its own, for /probe
+        return b"".join(self._family_text(name, lines) for name, lines in self._render_block(server_id, resolver_id, result).items())
+
+    def render(self, cache: ResultCache) -> bytes:
+        snapshot = cache.snapshot()
+        current = time.time()
+        if snapshot.generation == self.generation and not (self.expiry and self.expiry[0][0] <= current):
+            return self.body
+
+        dirty = set()
+        for key in snapshot.removed_since(self.generation):
+            self.expires.pop(key, None)
+            self._set_block(key, {}, dirty)
+
+        for key, entry in snapshot.changed_since(self.generation):
+            self._set_block(key, self._render_block(*key, entry.result), dirty)
+
+            if self.ttl is not None:
+                self.expires[key] = entry.result.timestamp.timestamp() + self.ttl
+                heapq.heappush(self.expiry, (self.expires[key], key))
+
+        self._expire(current, dirty)
+
+        for name in dirty:
+            if self.series[name]:
+                self.chunks[name] = self._render_family(name)
+            else:
+                self.chunks.pop(name, None)
+
+        self.body = b"".join(self.chunks.values())
+        self.gzipped = None
+        self.generation = snapshot.generation
+
+        return self.body
+
+    def render_gzip(self, cache: ResultCache, trailer: bytes = b"") -> bytes:
+        # a single gzip stream, some clients stop after the first of several concatenated members
+        self.render(cache)
+        if self.gzipped is None:
+            self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            self.gzipped = self.compressor.compress(self.body)
+
+        compressor = self.compressor.copy()
+        return self.gzipped + compressor.compress(trailer) + compressor.flush()
@@ -5,7 +5,7 @@ import dotenv
 
 logger = logging.getLogger()
 try:
-    from shared.shared import logger
+    from shared.shared import logger, configure_logging, stop_logging
 
     logger = logger('main')
 
@@ -16,8 +16,11 @@ try:
     import psutil
     from shared.config import Config
     from shared.cache import ResultCache
+    from shared import checkpoint
     import collector
     import publisher
+    import remote_write
+    import workers
     from pathlib import Path
 
     if __name__ == "__main__":
@@ -32,18 +35,35 @@ try:
 
         result_cache = ResultCache()
         config = Config(os.path.join(app_path, "config.yml"))
+        configure_logging(**config.logging)
 
-        collector_thread = threading.Thread(target=collector.invoke, args=(config, result_cache), name='data-collector')
+        if config.checkpoint:
+            checkpoint.load(config, result_cache)
+            checkpoint_thread = threading.Thread(target=checkpoint.invoke, args=(config, result_cache), name='checkpoint', daemon=True)
+            checkpoint_thread.start()
+
+        if config.remote_write:
+            # results restored from the checkpoint were already pushed before the restart
+            remote_write_thread = threading.Thread(target=remote_write.invoke, args=(config, result_cache, result_cache.generation), name='remote-write', daemon=True)
+            remote_write_thread.start()
+
+        # separate collector processes keep the publisher responsive while they are busy
+        target = workers.invoke if config.processes else collector.invoke
+        collector_thread = threading.Thread(target=target, args=(config, result_cache), name='data-collector')
         collector_thread.start()
 
         try:
             publisher.invoke(config, result_cache)
         except KeyboardInterrupt:
+            stop_logging()
             psutil.Process(os.getpid()).terminate()
         except BaseException as exception:
             logger.exception(exception)
+            stop_logging()
             psutil.Process(os.getpid()).terminate()
 
 except BaseException as exception:
     logger.exception(exception)
+    if 'stop_logging' in globals():
+        stop_logging()
     psutil.Process(os.getpid()).terminate()
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from prometheus_client import Counter, CONTENT_TYPE_LATEST
+
+from exposition import ExpositionCache
+from resolver.run_results import Result, SkippedRun
+from resolver.schema import check
+from shared.cache import ResultCache
+from shared.config import Config, Server
+from shared.shared import logger, normalize_hostname
+
+logger = logger('probe')
+
+PROBES = Counter(
+    "publisher_probes",
+    "Requests to /probe by outcome (cached, run, coalesced, failure)",
+    ["resolver_id", "outcome"],
+)
+
+
+# runs a resolver for a single target on demand, blackbox exporter style, so Prometheus' scrape scheduling drives it
+class Prober:
+    def __init__(self, config: Config, cache: ResultCache):
+        self.config = config
+        self.cache = cache
+        self.settings = config.probe
+        self.exposition = ExpositionCache()
+        self.executor = ThreadPoolExecutor(max_workers=self.settings["max_concurrency"], thread_name_prefix='probe')
+        # own resolver instances, the collector's are not meant to run concurrently
+        self.servers: dict[str, Server] = {}
+        self.config_mtime: int | None = None
+        self.next_reload = 0.0
+        self.inflight: dict[tuple[str, str], asyncio.Future] = {}
+
+    def register(self, app: web.Application):
+        app.add_routes([web.get("/probe", self._probe)])
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.config.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self.config_mtime:
+            return
+
+        try:
+            config = Config(self.config.path)
+            servers = config.servers
+        except Exception as exception:
+            logger.error(f"probing with the previous configuration, reloading '{self.config.path}' failed: {exception}")
+            self.config_mtime = mtime
+            return
+
+        # like the collector, resolvers whose configuration did not change keep their state
+        previous = {(server.hostname, r.resolver_id): r for server in self.servers.values() for r in server.resolvers}
+        for server in servers:
+            for index, resolver in enumerate(server.resolvers):
+                kept = previous.get((server.hostname, resolver.resolver_id))
+                if kept is not None and kept.config == resolver.config:
+                    server.resolvers[index] = kept
+
+        # only the servers of this shard, anything else is not ours to probe
+        by_hostname = {}
+        for server in servers:
+            try:
+                by_hostname[normalize_hostname(server.hostname)] = server
+            except ValueError as exception:
+                logger.warning(f"'{server.hostname}' cannot be probed: {exception}")
+
+        self.servers = by_hostname
+        self.config, self.config_mtime = config, mtime
+
+    def _server(self, target: str) -> Server | None:
+        # follows the live reload of the config.yml on the collector's schedule
+        reload_interval = self.config.reload_interval
+        if self.config_mtime is None or (reload_interval and time.monotonic() >= self.next_reload):
+            self.next_reload = time.monotonic() + (reload_interval or 0)
+            self._reload()
+        try:
+            return self.servers.get(normalize_hostname(target))
+        except ValueError:
+            raise web.HTTPBadRequest(text=f"invalid target '{target}'\n")
+
+    def _run(self, server: Server, resolver) -> Result:
+        result = resolver.run(server, self.cache.get(server.hostname, resolver.resolver_id))
+
+        if isinstance(result, SkippedRun):
+            last_result = self.cache.get(server.hostname, resolver.resolver_id)
+            if last_result is None:
+                raise RuntimeError(f"run skipped without an earlier result: {result.reason}")
+            return last_result
+        if not isinstance(result, Result):
+            raise ValueError("resolver response has to be of type Result|SkippedRun")
+
+        check(resolver.resolver_id, resolver.schema, result.metrics)
+        self.cache.update(server.hostname, resolver.resolver_id, result)
+        return result
+
+    async def _result(self, server: Server, resolver, timeout: float) -> tuple[Result, str]:
+        last_result = self.cache.get(server.hostname, resolver.resolver_id)
+        if last_result is not None and time.time() - last_result.timestamp.timestamp() <= self.settings["max_age_seconds"]:
+            return last_result, "cached"
+
+        key = (server.hostname, resolver.resolver_id)
+        future = self.inflight.get(key)
+        outcome = "coalesced"
+        if future is None:
+            # concurrent scrapes of the same target wait for the same run
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._run, server, resolver)
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+            outcome = "run"
+
+        # a scrape giving up must not cancel the run the others are waiting for
+        return await asyncio.wait_for(asyncio.shield(future), timeout), outcome
+
+    async def _probe(self, request):
+        target = request.query.get("target", "")
+        resolver_id = request.query.get("resolver", "network")
+        if not target:
+            raise web.HTTPBadRequest(text="target is required\n")
+
+        server = self._server(target)
+        if server is None:
+            raise web.HTTPNotFound(text=f"unknown target '{target}'\n")
+        resolver = next((r for r in server.resolvers if r.resolver_id == resolver_id), None)
+        if resolver is None:
+            raise web.HTTPNotFound(text=f"resolver '{resolver_id}' is not configured for '{target}'\n")
+
+        # a bit less than Prometheus' own timeout, so it still gets the failed probe
+        try:
+            scrape_timeout = float(request.headers.get("X-Prometheus-Scrape-Timeout-Seconds", self.settings["timeout_seconds"]))
+        except ValueError:
+            scrape_timeout = self.settings["timeout_seconds"]
+        timeout = min(self.settings["timeout_seconds"], max(scrape_timeout - 0.5, 0.5))
+
+        started = time.perf_counter()
+        body = b""
+        try:
+            result, outcome = await self._result(server, resolver, timeout)
+            body = self.exposition.render_result(server.hostname, resolver_id, result)
+            success = 1
+        except Exception as exception:
+            logger.warning(f"probe of {resolver_id} for '{target}' failed: {exception!r}")
+            outcome = "failure"
+            success = 0
+
+        PROBES.labels(resolver_id, outcome).inc()
+        body += (f"# HELP probe_success Whether the probe succeeded\n# TYPE probe_success gauge\nprobe_success {success}\n"
+                 f"# HELP probe_duration_seconds Duration of the probe\n# TYPE probe_duration_seconds gauge\n"
+                 f"probe_duration_seconds {time.perf_counter() - started}\n").encode()
+
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE_LATEST})
@@ -1,14 +1,38 @@
-from datetime import timezone
+import gzip
+import time
 
 from aiohttp import web
-from prometheus_client import Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
 
-from shared.cache import ResultCache, LabeledMetric
+from debug import DebugRoutes
+from exposition import ExpositionCache
+from probe import Prober
+from shared.cache import ResultCache
 from shared.config import Config
 from shared.shared import logger
 
 logger = logger('publisher')
 
+RENDER_DURATION = Histogram(
+    "publisher_render_duration_seconds",
+    "Time to render the /metrics response",
+    ["encoding"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+PAYLOAD_BYTES = Gauge(
+    "publisher_payload_bytes",
+    "Size of the last /metrics response body",
+    ["encoding"],
+)
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for encoding in accept_encoding.split(","):
+        name, _, params = encoding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
 
 class Publisher:
     def __init__(self, config: Config, cache: ResultCache):
@@ -16,56 +40,40 @@ class Publisher:
         self.config = config
         self.host = '0.0.0.0'
         self.port = 80
-        self.gauges = {}
+        self.exposition = ExpositionCache(config.metrics_ttl, config.max_series_per_metric)
+        # results are pushed with their own timestamps instead, only self-instrumentation is scraped
+        self.push = config.remote_write is not None
         self.app = web.Application()
         self.app.add_routes([web.get("/metrics", self._metrics)])
 
-    def _get_gauge(self, name: str, label_names: tuple[str, ...]):
-        key = (name, label_names)
-        if key not in self.gauges:
-            self.gauges[key] = Gauge(
-                name,
-                name,
-                ["server_id", *label_names],
-            )
-        return self.gauges[key]
-
-    def _set_metric(self, server_id: str, metric_name: str, value):
-        if isinstance(value, LabeledMetric):
-            label_name = f"{metric_name}_label"
-
-            gauge = self._get_gauge(
-                metric_name,
-                (label_name,)
-            )
-
-            gauge.labels(
-                server_id=server_id,
-                **{label_name: value.label}
-            ).set(value.value)
+        if config.probe:
+            Prober(config, cache).register(self.app)
 
-        else:
-            gauge = self._get_gauge(metric_name, ())
-            gauge.labels(
-                server_id=server_id
-            ).set(float(value))
+        if config.debug_endpoints:
+            logger.warning("debug endpoints are enabled on /debug/")
+            DebugRoutes().register(self.app)
 
     async def _metrics(self, request):
-        for server_id, resolvers in self.cache.get_all().items():
-            for resolver_id, result in resolvers.items():
-                self._set_metric(
-                    server_id,
-                    f"{resolver_id}_timestamp",
-                    result.timestamp.astimezone(timezone.utc).timestamp()
-                )
-
-                for metric, value in result.metrics.items():
-                    self._set_metric(server_id, f"{resolver_id}_{metric}", value)
-
-        return web.Response(
-            body=generate_latest(),
-            headers={"Content-Type": CONTENT_TYPE_LATEST},
-        )
+        started = time.perf_counter()
+        headers = {"Content-Type": CONTENT_TYPE_LATEST}
+
+        if accepts_gzip(request.headers.get("Accept-Encoding", "")):
+            encoding = "gzip"
+            headers["Content-Encoding"] = "gzip"
+            if self.push:
+                body = gzip.compress(generate_latest(), compresslevel=6)
+            else:
+                # the compressed results stay cached, only the self-instrumentation is compressed per scrape
+                body = self.exposition.render_gzip(self.cache, generate_latest())
+        else:
+            encoding = "identity"
+            results = b"" if self.push else self.exposition.render(self.cache)
+            body = results + generate_latest()
+
+        RENDER_DURATION.labels(encoding).observe(time.perf_counter() - started)
+        PAYLOAD_BYTES.labels(encoding).set(len(body))
+
+        return web.Response(body=body, headers=headers)
 
     def run(self):
         logger.info(f"Starting metrics endpoint on http://{self.host}:{self.port}/metrics")
@@ -0,0 +1,249 @@
+import os
+import struct
+import time
+import urllib.error
+import urllib.request
+
+from prometheus_client import Counter, Gauge
+
+from exposition import label_name, sanitize_name
+from resolver.run_results import Result
+from shared.cache import ResultCache, LabeledMetric
+from shared.config import Config
+from shared.shared import logger
+
+logger = logger('remote-write')
+
+WAL_SUFFIX = ".wal"
+WAL_HEADER = struct.Struct("<I")
+
+SAMPLES_SENT = Counter("remote_write_samples_sent", "Samples delivered to the remote-write endpoint")
+BATCHES_DROPPED = Counter("remote_write_batches_dropped", "Batches dropped from the WAL because it exceeded max_wal_bytes")
+SEND_FAILURES = Counter("remote_write_send_failures", "Failed attempts to deliver a batch")
+WAL_BYTES = Gauge("remote_write_wal_bytes", "Size of the batches waiting in the WAL")
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _length_delimited(field: int, payload: bytes) -> bytes:
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def encode_write_request(series: list[tuple[dict[str, str], list[tuple[float, int]]]]) -> bytes:
+    # prometheus.WriteRequest, see prometheus/prompb/remote.proto and types.proto
+    out = bytearray()
+    for labels, samples in series:
+        timeseries = bytearray()
+        for name, value in sorted(labels.items()):
+            timeseries += _length_delimited(1, _length_delimited(1, name.encode()) + _length_delimited(2, value.encode()))
+        for value, timestamp_ms in samples:
+            sample = b"\x09" + struct.pack("<d", value) + b"\x10" + _varint(timestamp_ms & 0xFFFFFFFFFFFFFFFF)
+            timeseries += _length_delimited(2, sample)
+        out += _length_delimited(1, bytes(timeseries))
+    return bytes(out)
+
+
+def snappy_compress(data: bytes) -> bytes:
+    # a valid snappy block made of literals only, the batches are small and this keeps us free of native dependencies
+    out = bytearray(_varint(len(data)))
+    for start in range(0, len(data), 65536):
+        chunk = data[start:start + 65536]
+        length = len(chunk) - 1
+        if length < 60:
+            out.append(length << 2)
+        elif length < 256:
+            out += bytes((60 << 2, length))
+        else:
+            out += bytes((61 << 2,)) + length.to_bytes(2, "little")
+        out += chunk
+    return bytes(out)
+
+
+def snappy_decompress(data: bytes) -> bytes:
+    length, shift, position = 0, 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        length |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+
+    out = bytearray()
+    while position < len(data):
+        tag = data[position]
+        position += 1
+        kind = tag & 0x03
+
+        if kind == 0:
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[position:position + extra], "little")
+                position += extra
+            size += 1
+            out += data[position:position + size]
+            position += size
+            continue
+
+        if kind == 1:
+            size = ((tag >> 2) & 0x07) + 4
+            offset = ((tag >> 5) << 8) | data[position]
+            position += 1
+        else:
+            size = (tag >> 2) + 1
+            width = 2 if kind == 2 else 4
+            offset = int.from_bytes(data[position:position + width], "little")
+            position += width
+
+        for _ in range(size):
+            out.append(out[-offset])
+
+    if len(out) != length:
+        raise ValueError("corrupt snappy block")
+    return bytes(out)
+
+
+def series_for(server_id: str, resolver_id: str, result: Result) -> list[tuple[dict[str, str], list[tuple[float, int]]]]:
+    timestamp_ms = int(result.timestamp.timestamp() * 1000)
+    series = [(
+        {"__name__": sanitize_name(f"{resolver_id}_timestamp"), "server_id": server_id},
+        [(result.timestamp.timestamp(), timestamp_ms)],
+    )]
+
+    for metric, value in result.metrics.items():
+        name = f"{resolver_id}_{metric}"
+        for v in value if isinstance(value, (list, tuple)) else (value,):
+            labels = {"__name__": sanitize_name(name), "server_id": server_id}
+            if isinstance(v, LabeledMetric):
+                labels[label_name(name, v)] = str(v.label)
+                v = v.value
+            series.append((labels, [(float(v), timestamp_ms)]))
+
+    return series
+
+
+class Wal:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+        self.segments = sorted(name for name in os.listdir(path) if name.endswith(WAL_SUFFIX))
+        self.sequence = int(self.segments[-1][:-len(WAL_SUFFIX)]) + 1 if self.segments else 0
+        self.size = sum(os.path.getsize(os.path.join(path, name)) for name in self.segments)
+        WAL_BYTES.set(self.size)
+
+    def append(self, batch: bytes, samples: int):
+        name = f"{self.sequence:016d}{WAL_SUFFIX}"
+        self.sequence += 1
+
+        file_path = os.path.join(self.path, name)
+        with open(file_path + ".tmp", "wb") as f:
+            f.write(WAL_HEADER.pack(samples))
+            f.write(batch)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(file_path + ".tmp", file_path)
+
+        self.segments.append(name)
+        self.size += WAL_HEADER.size + len(batch)
+
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            logger.warning(f"WAL exceeds {self.max_bytes} bytes, dropping the oldest batch")
+            self.pop()
+            BATCHES_DROPPED.inc()
+
+        WAL_BYTES.set(self.size)
+
+    def peek(self) -> tuple[int, bytes] | None:
+        if not self.segments:
+            return None
+        with open(os.path.join(self.path, self.segments[0]), "rb") as f:
+            data = f.read()
+        return WAL_HEADER.unpack_from(data)[0], data[WAL_HEADER.size:]
+
+    def pop(self):
+        file_path = os.path.join(self.path, self.segments.pop(0))
+        self.size -= os.path.getsize(file_path)
+        os.remove(file_path)
+        WAL_BYTES.set(self.size)
+
+
+class RemoteWriter:
+    def __init__(self, config: Config, cache: ResultCache, generation: int = 0):
+        self.cache = cache
+        self.settings = config.remote_write
+        self.url = self.settings["url"]
+        self.flush_interval = self.settings.get("flush_interval_seconds", 5)
+        self.timeout = self.settings.get("timeout_seconds", 10)
+        self.wal = Wal(self.settings.get("wal_path", "/storage/remote-write"), self.settings.get("max_wal_bytes", 256 * 2 ** 20))
+        self.generation = generation
+        self.backoff = 0.0
+
+    def _collect(self):
+        snapshot = self.cache.snapshot()
+        series = []
+        for (server_id, resolver_id), entry in snapshot.changed_since(self.generation):
+            series += series_for(server_id, resolver_id, entry.result)
+
+        self.generation = snapshot.generation
+        if series:
+            self.wal.append(snappy_compress(encode_write_request(series)), len(series))
+
+    def _send(self, batch: bytes):
+        request = urllib.request.Request(self.url, data=batch, method="POST", headers={
+            "Content-Encoding": "snappy",
+            "Content-Type": "application/x-protobuf",
+            "User-Agent": "server-monitoring-data-collector",
+            "X-Prometheus-Remote-Write-Version": "0.1.0",
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def _flush(self):
+        while (pending := self.wal.peek()) is not None:
+            samples, batch = pending
+            try:
+                self._send(batch)
+            except urllib.error.HTTPError as exception:
+                if 400 <= exception.code < 500 and exception.code != 429:
+                    # the receiver will never accept this batch, e.g. out of order samples
+                    logger.warning(f"remote-write rejected a batch: {exception.code} {exception.reason}")
+                    self.wal.pop()
+                    continue
+                raise
+
+            SAMPLES_SENT.inc(samples)
+            self.wal.pop()
+
+    def run(self):
+        logger.info(f"pushing results to {self.url}")
+        while True:
+            time.sleep(self.flush_interval + self.backoff)
+            self._collect()
+
+            try:
+                self._flush()
+                self.backoff = 0.0
+            except (OSError, urllib.error.URLError) as exception:
+                SEND_FAILURES.inc()
+                self.backoff = min(max(self.backoff * 2, self.flush_interval), 300)
+                logger.warning(f"remote-write failed, retrying in {self.flush_interval + self.backoff:.1f}s: {exception}")
+
+
+def invoke(config: Config, cache: ResultCache, generation: int = 0):
+    try:
+        RemoteWriter(config, cache, generation).run()
+    except BaseException as exception:
+        logger.exception(exception)
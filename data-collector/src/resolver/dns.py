@@ -0,0 +1,108 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Counter
+
+from shared.shared import logger
+
+logger = logger('dns')
+
+LOOKUPS = Counter(
+    "collector_dns_lookups",
+    "Hostname lookups of the collector-wide DNS cache by outcome (success, failure)",
+    ["outcome"],
+)
+
+
+def lookup(hostname: str) -> str:
+    # IPv4, like the ICMP engine
+    return socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_RAW)[0][4][0]
+
+
+class _Entry:
+    __slots__ = ("address", "resolved", "failed")
+
+    def __init__(self, address: str | None, resolved: float, failed: float = 0.0):
+        self.address = address
+        self.resolved = resolved
+        self.failed = failed
+
+
+# resolves every hostname once and refreshes it in the background, the last good address survives DNS outages
+class DnsCache:
+    def __init__(self, ttl: float = 300, max_stale: float = 86400, negative_ttl: float = 30, lookup=lookup):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.negative_ttl = negative_ttl
+        self.lookup = lookup
+        self.entries: dict[str, _Entry] = {}
+        self.refreshing: set[str] = set()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="dns-refresh")
+
+    def _refresh(self, hostname: str) -> str | None:
+        current = time.monotonic()
+        try:
+            address = self.lookup(hostname)
+        except OSError as exception:
+            LOOKUPS.labels("failure").inc()
+            with self.lock:
+                self.refreshing.discard(hostname)
+                entry = self.entries.get(hostname)
+                if entry is None or current - entry.resolved > self.ttl + self.max_stale:
+                    self.entries[hostname] = entry = _Entry(None, current)
+                entry.failed = current
+
+            if entry.address is not None:
+                logger.warning(f"resolving '{hostname}' failed, keeping {entry.address}: {exception}")
+            else:
+                logger.warning(f"resolving '{hostname}' failed: {exception}")
+            return entry.address
+
+        LOOKUPS.labels("success").inc()
+        with self.lock:
+            self.refreshing.discard(hostname)
+            previous = self.entries.get(hostname)
+            self.entries[hostname] = _Entry(address, current)
+
+        if previous is not None and previous.address not in (None, address):
+            logger.info(f"'{hostname}' moved from {previous.address} to {address}")
+        return address
+
+    def resolve(self, hostname: str) -> str | None:
+        current = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(hostname)
+            if entry is not None and entry.failed and current - entry.failed < self.negative_ttl:
+                return entry.address
+
+            if entry is not None and entry.address is not None:
+                # refresh a bit early, so the hosts probed regularly never wait for a lookup
+                if current - entry.resolved >= self.ttl * 0.8 and hostname not in self.refreshing:
+                    self.refreshing.add(hostname)
+                    self.executor.submit(self._refresh, hostname)
+                return entry.address
+
+        return self._refresh(hostname)
+
+
+shared_cache: DnsCache | None = None
+_shared_cache_lock = threading.Lock()
+
+
+def configure(ttl: float, max_stale: float):
+    global shared_cache
+
+    with _shared_cache_lock:
+        shared_cache = DnsCache(ttl, max_stale)
+
+
+def cache() -> DnsCache:
+    global shared_cache
+
+    with _shared_cache_lock:
+        if shared_cache is None:
+            shared_cache = DnsCache()
+        return shared_cache
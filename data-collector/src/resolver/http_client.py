@@ -0,0 +1,46 @@
+import asyncio
+import atexit
+import threading
+
+import aiohttp
+
+
+class HttpClient:
+    def __init__(self, timeout: float = 5):
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.sessions: dict[str, aiohttp.ClientSession] = {}
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, name="http-client", daemon=True).start()
+        atexit.register(self.close)
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def session(self, base_url: str, max_connections: int = 2) -> aiohttp.ClientSession:
+        # one pooled keep-alive session per base_url, only ever touched from the client loop
+        if base_url not in self.sessions:
+            self.sessions[base_url] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=max_connections, keepalive_timeout=60, ttl_dns_cache=300),
+                timeout=self.timeout,
+            )
+        return self.sessions[base_url]
+
+    async def _close(self):
+        for session in self.sessions.values():
+            await session.close()
+
+    def close(self):
+        self.run(self._close())
+
+
+shared_client: HttpClient | None = None
+_shared_client_lock = threading.Lock()
+
+
+def client() -> HttpClient:
+    global shared_client
+
+    with _shared_client_lock:
+        if shared_client is None:
+            shared_client = HttpClient()
+        return shared_client
@@ -0,0 +1,361 @@
+import collections
+import heapq
+import itertools
+import os
+import random
+import socket
+import statistics
+import struct
+import threading
+import time
+
+from resolver import dns
+
+ICMP_ECHO_REPLY = 0
+ICMP_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+ICMP_HEADER = struct.Struct("!BBHHH")
+PAYLOAD_SIZE = 56
+
+
+def checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\x00"
+
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+
+    return ~total & 0xFFFF
+
+
+def echo_request(identifier: int, sequence: int) -> bytes:
+    payload = struct.pack("!d", time.time()).ljust(PAYLOAD_SIZE, b"\x00")
+    header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    return ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header + payload), identifier, sequence) + payload
+
+
+def open_icmp_socket() -> socket.socket:
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+    except PermissionError:
+        # unprivileged ping sockets, the kernel rewrites the identifier to the socket's port
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+
+
+class PingStats:
+    def __init__(self, sent: int = 0):
+        self.sent = sent
+        self.rtts: list[float] = []
+
+    @property
+    def received(self) -> int:
+        return len(self.rtts)
+
+    @property
+    def min(self) -> float:
+        return min(self.rtts) if self.rtts else 0.0
+
+    @property
+    def max(self) -> float:
+        return max(self.rtts) if self.rtts else 0.0
+
+    @property
+    def avg(self) -> float:
+        return statistics.mean(self.rtts) if self.rtts else 0.0
+
+    @property
+    def jitter(self) -> float:
+        return statistics.pstdev(self.rtts) if len(self.rtts) > 1 else 0.0
+
+    @property
+    def loss(self) -> float:
+        return 100 * (1 - self.received / self.sent) if self.sent else 100.0
+
+    def record(self, rtt: float, address: str, icmp_type: int):
+        if icmp_type == ICMP_ECHO_REPLY:
+            self.rtts.append(rtt)
+
+
+class HopStats(PingStats):
+    def __init__(self, sent: int = 0):
+        super().__init__(sent)
+        self.responders: collections.Counter[str] = collections.Counter()
+        self.reached = False
+
+    @property
+    def host(self) -> str:
+        # the hop answering most probes, load balanced paths change between them
+        return self.responders.most_common(1)[0][0] if self.responders else "???"
+
+    def record(self, rtt: float, address: str, icmp_type: int):
+        self.rtts.append(rtt)
+        self.responders[address] += 1
+        # an unreachable destination ends the path as well
+        self.reached = self.reached or icmp_type != ICMP_TIME_EXCEEDED
+
+
+class TracerouteUnavailable(RuntimeError):
+    pass
+
+
+class _Batch:
+    def __init__(self, outstanding: int):
+        self.outstanding = outstanding
+        self.done = threading.Event()
+
+
+class IcmpEngine:
+    def __init__(self, socket_factory=open_icmp_socket):
+        self.socket_factory = socket_factory
+        self.identifier = os.getpid() & 0xFFFF
+        self.sequence = itertools.count(random.randrange(0xFFFF))
+        self.pending: dict[tuple[str, int], tuple[PingStats, _Batch, float]] = {}
+        self.lock = threading.Lock()
+        self.socket = None
+
+    def _start(self):
+        with self.lock:
+            if self.socket is not None:
+                return
+
+            self.socket = self.socket_factory()
+            self.socket.settimeout(1.0)
+            threading.Thread(target=self._receive, name="icmp-receiver", daemon=True).start()
+
+    def _receive(self):
+        raw = self.socket.type == socket.SOCK_RAW
+
+        while True:
+            try:
+                packet, (address, _) = self.socket.recvfrom(1024)
+            except (TimeoutError, socket.timeout):
+                continue
+
+            received_at = time.perf_counter()
+            if raw:
+                packet = packet[(packet[0] & 0x0F) * 4:]
+
+            if len(packet) < ICMP_HEADER.size:
+                continue
+
+            icmp_type, _, _, identifier, sequence = ICMP_HEADER.unpack_from(packet)
+            if icmp_type == ICMP_ECHO_REPLY:
+                key = (address, sequence)
+            elif raw and icmp_type in (ICMP_TIME_EXCEEDED, ICMP_UNREACHABLE):
+                # routers quote the IP header and the first 8 bytes of the probe that expired
+                quoted = packet[ICMP_HEADER.size:]
+                if len(quoted) < 20 or len(quoted) < (quoted[0] & 0x0F) * 4 + ICMP_HEADER.size:
+                    continue
+                _, _, _, identifier, sequence = ICMP_HEADER.unpack_from(quoted, (quoted[0] & 0x0F) * 4)
+                key = (socket.inet_ntoa(quoted[16:20]), sequence)
+            else:
+                continue
+
+            if raw and identifier != self.identifier:
+                continue
+
+            with self.lock:
+                entry = self.pending.pop(key, None)
+                if entry is None:
+                    continue
+
+                stats, batch, sent_at = entry
+                stats.record((received_at - sent_at) * 1000, address, icmp_type)
+                batch.outstanding -= 1
+                if batch.outstanding == 0:
+                    batch.done.set()
+
+    def ping_many(self, hosts: list[str], count: int = 10, interval: float = 0.1, timeout: float = 2.0) -> dict[str, PingStats]:
+        self._start()
+
+        results = {host: PingStats(count) for host in hosts}
+        addresses = {}
+        for host in hosts:
+            address = dns.cache().resolve(host)
+            if address is not None:
+                addresses[host] = address
+
+        if not addresses:
+            return results
+
+        batch = _Batch(count * len(addresses))
+        keys = []
+        for index in range(count):
+            for host, address in addresses.items():
+                with self.lock:
+                    key = (address, next(self.sequence) & 0xFFFF)
+                    packet = echo_request(self.identifier, key[1])
+                    self.pending[key] = (results[host], batch, time.perf_counter())
+                keys.append(key)
+
+                try:
+                    self.socket.sendto(packet, (address, 0))
+                except OSError:
+                    with self.lock:
+                        if self.pending.pop(key, None) is not None:
+                            batch.outstanding -= 1
+
+            if index < count - 1:
+                time.sleep(interval)
+
+        with self.lock:
+            if batch.outstanding <= 0:
+                batch.done.set()
+
+        batch.done.wait(timeout)
+
+        with self.lock:
+            for key in keys:
+                self.pending.pop(key, None)
+
+        return results
+
+    def trace_many(self, hosts: list[str], count: int = 10, interval: float = 0.25, timeout: float = 2.0,
+                   max_hops: int = 30) -> dict[str, list[HopStats]]:
+        self._start()
+        if self.socket.type != socket.SOCK_RAW:
+            raise TracerouteUnavailable("TTL limited probes need a raw ICMP socket (CAP_NET_RAW)")
+
+        results = {host: [HopStats() for _ in range(max_hops)] for host in hosts}
+        addresses = {}
+        for host in hosts:
+            address = dns.cache().resolve(host)
+            if address is not None:
+                addresses[host] = address
+
+        # one outstanding probe for the sending loop itself, the batch cannot complete before every probe is sent
+        batch = _Batch(1)
+        keys = []
+        for index in range(count):
+            for host, address in addresses.items():
+                hops = results[host]
+                # every hop at once, beyond the destination only until its distance is known
+                last = next((ttl for ttl, hop in enumerate(hops, 1) if hop.reached), max_hops)
+                for ttl in range(1, last + 1):
+                    with self.lock:
+                        key = (address, next(self.sequence) & 0xFFFF)
+                        packet = echo_request(self.identifier, key[1])
+                        hops[ttl - 1].sent += 1
+                        self.pending[key] = (hops[ttl - 1], batch, time.perf_counter())
+                        batch.outstanding += 1
+                    keys.append(key)
+
+                    try:
+                        self.socket.sendmsg([packet], [(socket.IPPROTO_IP, socket.IP_TTL, struct.pack("i", ttl))], 0, (address, 0))
+                    except OSError:
+                        with self.lock:
+                            if self.pending.pop(key, None) is not None:
+                                batch.outstanding -= 1
+
+            if index < count - 1:
+                time.sleep(interval)
+
+        with self.lock:
+            batch.outstanding -= 1
+            if batch.outstanding <= 0:
+                batch.done.set()
+
+        batch.done.wait(timeout)
+
+        with self.lock:
+            for key in keys:
+                self.pending.pop(key, None)
+
+        traces = {}
+        for host, hops in results.items():
+            last = next((ttl for ttl, hop in enumerate(hops, 1) if hop.reached), None)
+            if last is None:
+                # like mtr, a path that never reached the destination ends with the last hop that answered
+                last = max((ttl for ttl, hop in enumerate(hops, 1) if hop.received), default=0)
+            traces[host] = hops[:last]
+        return traces
+
+
+def ip_header(source: str, destination: str, length: int) -> bytes:
+    return struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + length, 0, 0, 64, socket.IPPROTO_ICMP, 0,
+                       socket.inet_aton(source), socket.inet_aton(destination))
+
+
+# stand-in for the ICMP socket without network access, answers every echo request after `latency` seconds,
+# with `hops` it acts as a raw socket behind a path of that length and answers TTL limited probes like routers do
+class LoopbackIcmpSocket:
+    def __init__(self, latency=0.01, loss: float = 0.0, hops: int = 0):
+        self.latency = latency
+        self.loss = loss
+        self.hops = hops
+        self.type = socket.SOCK_RAW if hops else socket.SOCK_DGRAM
+        self.timeout = None
+        self.replies: list[tuple[float, int, bytes, str]] = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def settimeout(self, timeout: float):
+        self.timeout = timeout
+
+    def sendto(self, packet: bytes, address: tuple[str, int]):
+        return self._answer(packet, address[0], 64)
+
+    def sendmsg(self, buffers, ancdata=(), flags: int = 0, address: tuple[str, int] | None = None):
+        ttl = next((struct.unpack("i", data)[0] for _, kind, data in ancdata if kind == socket.IP_TTL), 64)
+        return self._answer(b"".join(buffers), address[0], ttl)
+
+    def _answer(self, packet: bytes, destination: str, ttl: int):
+        if random.random() < self.loss:
+            return len(packet)
+
+        latency = self.latency(destination) if callable(self.latency) else self.latency
+        if latency is None:
+            return len(packet)
+
+        _, code, _, identifier, sequence = ICMP_HEADER.unpack_from(packet)
+        if self.hops and ttl < self.hops:
+            source = f"10.{ttl}.0.1"
+            latency *= ttl / self.hops
+            payload = ip_header("127.0.0.1", destination, len(packet)) + packet[:ICMP_HEADER.size]
+            icmp_type, code, identifier, sequence = ICMP_TIME_EXCEEDED, 0, 0, 0
+        else:
+            source = destination
+            payload = packet[ICMP_HEADER.size:]
+            icmp_type = ICMP_ECHO_REPLY
+
+        header = ICMP_HEADER.pack(icmp_type, code, 0, identifier, sequence)
+        reply = ICMP_HEADER.pack(icmp_type, code, checksum(header + payload), identifier, sequence) + payload
+        if self.hops:
+            reply = ip_header(source, "127.0.0.1", len(reply)) + reply
+
+        with self.condition:
+            heapq.heappush(self.replies, (time.perf_counter() + latency, next(self.counter), reply, source))
+            self.condition.notify()
+
+        return len(packet)
+
+    def recvfrom(self, size: int) -> tuple[bytes, tuple[str, int]]:
+        deadline = time.perf_counter() + (self.timeout or 0)
+
+        with self.condition:
+            while True:
+                current = time.perf_counter()
+                if self.replies and self.replies[0][0] <= current:
+                    _, _, reply, address = heapq.heappop(self.replies)
+                    return reply[:size], (address, 0)
+
+                if current >= deadline:
+                    raise TimeoutError()
+
+                wake = min(deadline, self.replies[0][0]) if self.replies else deadline
+                self.condition.wait(wake - current)
+
+
+shared_engine: IcmpEngine | None = None
+_shared_engine_lock = threading.Lock()
+
+
+def engine() -> IcmpEngine:
+    global shared_engine
+
+    with _shared_engine_lock:
+        if shared_engine is None:
+            shared_engine = IcmpEngine()
+        return shared_engine
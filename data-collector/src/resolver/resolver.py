@@ -4,12 +4,16 @@ from abc import ABC, abstractmethod
 from logging import Logger
 from typing import Dict, Type, Union
 import shared.shared
+from resolver.schema import Metric, validate
 
 
 class Resolver(ABC):
     _registry: Dict[str, Type["Resolver"]] = {}
 
     resolver_id: str
+    default_interval: int | None = None
+    # metric name (without the resolver_id prefix) -> declaration, results may only contain these
+    schema: Dict[str, Metric]
 
     def __init__(self, config: dict, logger: Logger):
         self.config = config
@@ -20,6 +24,9 @@ class Resolver(ABC):
 
         if not hasattr(cls, "resolver_id") or not cls.resolver_id:
             raise TypeError(f"{cls.__name__} must define a class-level 'resolver_id'")
+        if not isinstance(cls.__dict__.get("schema"), dict):
+            raise TypeError(f"{cls.__name__} must declare its metrics in a class-level 'schema'")
+        validate(cls.resolver_id, cls.schema)
 
         Resolver._registry[cls.resolver_id] = cls
 
@@ -1,33 +1,142 @@
-import requests
+import asyncio
+import time
+from logging import Logger
 
+from prometheus_client import Counter
+
+from resolver import http_client
 from resolver.resolver import Resolver
-from resolver.run_results import Result
+from resolver.run_results import Result, SkippedRun
+from resolver.schema import Metric
 from shared.cache import LabeledMetric
+from shared.shared import now
+
+REQUESTS = Counter(
+    "collector_crcon_requests",
+    "Requests sent to CRCON instances",
+    ["endpoint"],
+)
 
 
 class HLLCrconResolver(Resolver):
     resolver_id = "hll-crcon"
+    schema = {
+        "player_count": Metric("Players on the server"),
+        "game_time": Metric("Elapsed time of the current match, labeled with the map", "seconds", label="hll_crcon_game_time_label"),
+        "game_mode": Metric("Game mode of the current match, always 1", label="hll_crcon_game_mode_label"),
+        "team_score": Metric("Score per team", label="team"),
+        "team_players": Metric("Players per team", label="team"),
+        "map_rotation": Metric("Position of the map in the rotation", label="map"),
+    }
+
+    def __init__(self, config: dict, logger: Logger):
+        super().__init__(config, logger)
+        self.gamestate_ttl = config.get("gamestate_ttl_seconds", 60)
+        self.gamestate_min_age = config.get("gamestate_min_age_seconds", 15)
+        self.rotation_ttl = config.get("rotation_ttl_seconds", 900)
+        self.heartbeat = config.get("heartbeat_seconds", 300)
+        # endpoint -> (monotonic time of the fetch, result)
+        self.details: dict[str, tuple[float, dict | list]] = {}
+        self.player_count: int | None = None
+        # what the last published result was computed from
+        self.inputs: tuple | None = None
+
+    @staticmethod
+    def _game_time(state: dict, age: float) -> float:
+        # time_remaining is only fetched with the gamestate, the clock keeps running in between
+        return min(state['match_time'] - state['time_remaining'] + age, state['match_time'])
+
+    def _stale(self, status: dict, current: float) -> list[str]:
+        endpoints = []
+        map_changed = False
+
+        gamestate = self.details.get("get_gamestate")
+        if gamestate is None:
+            endpoints.append("get_gamestate")
+        else:
+            fetched, state = gamestate
+            age = current - fetched
+            status_map = (status.get('map') or {}).get('id')
+            map_changed = status_map is not None and status_map != state['current_map'].get('id')
+            match_over = self._game_time(state, age) >= state['match_time']
+            players_moved = status['current_players'] != self.player_count and age >= self.gamestate_min_age
+
+            if map_changed or match_over or players_moved or age >= self.gamestate_ttl:
+                endpoints.append("get_gamestate")
+
+        rotation = self.details.get("get_map_rotation")
+        if rotation is None or map_changed or current - rotation[0] >= self.rotation_ttl:
+            endpoints.append("get_map_rotation")
+
+        return endpoints
 
     def run(self, server: "Server", last_result: Result | None):
-        state_result = self._query_rcon("get_gamestate")
-        status_result = self._query_rcon("get_status")
-
-        return Result(
-            metrics={
-                "player_count": status_result['result']['current_players'],
-                "game_time": LabeledMetric(state_result['result']['match_time'] - state_result['result']['time_remaining'], state_result['result']['current_map']['map']['id']),
-                "game_mode": LabeledMetric(1, state_result['result']['current_map']['game_mode']),
-            },
-            resolver=self
-        )
-
-    def _query_rcon(self, endpoint: str) -> dict:
-        response = requests.get(f"{self.config.base_url}/{endpoint}", headers={
+        # a cheap status poll every run, the heavier endpoints only when it shows they changed or their TTL expired
+        status = http_client.client().run(self._query_rcon("get_status"))['result']
+        current = time.monotonic()
+
+        stale = self._stale(status, current)
+        if stale:
+            responses = http_client.client().run(self._query_all(stale))
+            for endpoint, response in zip(stale, responses):
+                if isinstance(response, BaseException):
+                    if endpoint == "get_gamestate":
+                        raise response
+                    # older CRCON versions without a map rotation endpoint
+                    self.logger.debug(f"{endpoint} failed for '{server.hostname}': {response!r}")
+                    self.details[endpoint] = (current, [])
+                else:
+                    self.details[endpoint] = (current, response['result'])
+
+        self.player_count = status['current_players']
+        fetched, state = self.details["get_gamestate"]
+
+        # game_time is extrapolated and differs on every run, so compare what the result is computed from instead
+        inputs = (status['current_players'], (status.get('map') or {}).get('id'), fetched, self.details["get_map_rotation"][0])
+        if last_result is not None and inputs == self.inputs and \
+                (now() - last_result.timestamp).total_seconds() < self.heartbeat:
+            return SkippedRun(self, "unchanged")
+
+        map_id = state['current_map']['map']['id']
+
+        metrics = {
+            "player_count": status['current_players'],
+            "game_time": LabeledMetric(self._game_time(state, current - fetched), map_id, "hll_crcon_game_time_label"),
+            "game_mode": LabeledMetric(1, state['current_map']['game_mode'], "hll_crcon_game_mode_label"),
+        }
+        if 'allied_score' in state:
+            metrics["team_score"] = [
+                LabeledMetric(state['allied_score'], "allies", "team"),
+                LabeledMetric(state['axis_score'], "axis", "team"),
+            ]
+        if 'num_allied_players' in state:
+            metrics["team_players"] = [
+                LabeledMetric(state['num_allied_players'], "allies", "team"),
+                LabeledMetric(state['num_axis_players'], "axis", "team"),
+            ]
+        rotation = self.details["get_map_rotation"][1]
+        if rotation:
+            # a layer can be in the rotation more than once, its first position is kept so the series stay unique
+            positions = {}
+            for position, layer in enumerate(rotation):
+                positions.setdefault(layer['id'] if isinstance(layer, dict) else layer, position)
+            metrics["map_rotation"] = [LabeledMetric(position, layer, "map") for layer, position in positions.items()]
+
+        self.inputs = inputs
+        return Result(metrics=metrics, resolver=self)
+
+    async def _query_all(self, endpoints: list[str]) -> list:
+        return await asyncio.gather(*(self._query_rcon(endpoint) for endpoint in endpoints), return_exceptions=True)
+
+    async def _query_rcon(self, endpoint: str) -> dict:
+        REQUESTS.labels(endpoint).inc()
+        session = http_client.client().session(self.config.base_url, self.config.get("max_connections", 2))
+        async with session.get(f"{self.config.base_url}/{endpoint}", headers={
             "Authorization": f"Bearer {self.config.api_key}"
-        }, timeout=5)
-        response.raise_for_status()
+        }) as response:
+            response.raise_for_status()
+            result = await response.json(content_type=None)
 
-        result = response.json()
         if result['failed']:
             raise RuntimeError(result['error'])
 
@@ -1,45 +1,90 @@
-import statistics
-
-from ping3 import ping
+import math
+import time
+from logging import Logger
 
+from resolver import dns, icmp
 from resolver.resolver import Resolver
 from resolver.run_results import Result
+from resolver.schema import Metric
+from shared.cache import LabeledMetric
+from shared.history import RingBuffer, percentile, window_label
+
+PERCENTILES = {"ping_p50": 0.5, "ping_p95": 0.95, "ping_p99": 0.99}
 
 
 class NetworkResolver(Resolver):
     resolver_id = "network"
+    schema = {
+        "packet_count": Metric("Echo replies received in the last run"),
+        "ping_min": Metric("Lowest round trip time of the last run", "milliseconds"),
+        "ping_max": Metric("Highest round trip time of the last run", "milliseconds"),
+        "ping_avg": Metric("Mean round trip time of the last run", "milliseconds"),
+        "jitter": Metric("Standard deviation of the round trip times of the last run", "milliseconds"),
+        "packet_loss": Metric("Echo requests without a reply in the last run", "percent"),
+        "ping_ewma": Metric("Exponentially weighted moving average of all round trip times", "milliseconds"),
+        "address": Metric("IPv4 address the server resolved to, always 1", label="address"),
+        "ping_p50": Metric("Median round trip time over the window", "milliseconds", label="window"),
+        "ping_p95": Metric("95th percentile round trip time over the window", "milliseconds", label="window"),
+        "ping_p99": Metric("99th percentile round trip time over the window", "milliseconds", label="window"),
+        "packet_loss_window": Metric("Echo requests without a reply over the window", "percent", label="window"),
+    }
 
-    def run(self, server: "Server", last_result: Result | None):
-        times = []
-        packets = 10
+    def __init__(self, config: dict, logger: Logger):
+        super().__init__(config, logger)
+        # one resolver per server, so this is the history of a single server
+        self.history = RingBuffer(config.get("history_samples", 1024))
+        self.windows = config.get("history_windows_seconds", [300, 900])
+        self.ewma_alpha = config.get("ewma_alpha", 0.1)
+        self.ewma: float | None = None
+
+    def _windowed(self, current: float) -> dict:
+        metrics = {name: [] for name in PERCENTILES}
+        metrics["packet_loss_window"] = []
 
-        for _ in range(packets):
-            rtt = ping(server.hostname, timeout=10)
-            if rtt is not None and rtt is not False:
-                times.append(rtt * 1000)
+        for seconds in self.windows:
+            label = window_label(seconds)
+            samples = self.history.window(seconds, current)
+            if not samples:
+                continue
 
-        if times:
-            ping_min = min(times)
-            ping_max = max(times)
-            ping_avg = statistics.mean(times)
+            rtts = sorted(rtt for rtt in samples if not math.isnan(rtt))
+            metrics["packet_loss_window"].append(LabeledMetric(100 * (1 - len(rtts) / len(samples)), label, "window"))
+            if rtts:
+                for name, q in PERCENTILES.items():
+                    metrics[name].append(LabeledMetric(percentile(rtts, q), label, "window"))
 
-            jitter = statistics.pstdev(times) if len(times) > 1 else 0.0
+        return metrics
 
-            packet_loss = 100 * (1 - len(times) / packets)
+    def run(self, server: "Server", last_result: Result | None):
+        packets = self.config.get("packets", 10)
+        stats = icmp.engine().ping_many(
+            [server.hostname],
+            count=packets,
+            interval=self.config.get("interval", 0.1),
+            timeout=self.config.get("timeout", 2.0),
+        )[server.hostname]
 
-        else:
+        if not stats.received:
             self.logger.warning(f"ping failed for '{server.hostname}'")
-            ping_min = ping_max = ping_avg = jitter = 0.0
-            packet_loss = 100.0
-
-        return Result(
-            metrics={
-                "packet_count": len(times),
-                "ping_min": ping_min,
-                "ping_max": ping_max,
-                "ping_avg": ping_avg,
-                "jitter": jitter,
-                "packet_loss": packet_loss,
-            },
-            resolver=self,
-        )
+
+        current = time.time()
+        self.history.extend(current, stats.rtts + [math.nan] * (stats.sent - stats.received))
+        for rtt in stats.rtts:
+            self.ewma = rtt if self.ewma is None else self.ewma_alpha * rtt + (1 - self.ewma_alpha) * self.ewma
+
+        metrics = {
+            "packet_count": stats.received,
+            "ping_min": stats.min,
+            "ping_max": stats.max,
+            "ping_avg": stats.avg,
+            "jitter": stats.jitter,
+            "packet_loss": stats.loss,
+        }
+        if self.ewma is not None:
+            metrics["ping_ewma"] = self.ewma
+        address = dns.cache().resolve(server.hostname)
+        if address is not None:
+            metrics["address"] = LabeledMetric(1, address, "address")
+        metrics.update(self._windowed(current))
+
+        return Result(metrics=metrics, resolver=self)
@@ -1,34 +1,75 @@
+import hashlib
 import json
-import os
 import re
 import subprocess
-from datetime import datetime, timedelta, timezone
-
-import idna
+from logging import Logger
 
+from resolver import dns, icmp
 from resolver.resolver import Resolver
-from resolver.run_results import Result, SkippedRun
-from shared.shared import now
+from resolver.run_results import Result
+from resolver.schema import Metric
+from resolver.traceroute_store import TracerouteStore, BASE_STORAGE_PATH
+from shared.cache import LabeledMetric
+from shared.shared import now, normalize_hostname
 
-BASE_STORAGE_PATH = "/storage/traceroutes"
 DOMAIN_RE = re.compile(r"^[a-z0-9.-]+$")
+MTR_GRACE_SECONDS = 20
 
 
 class NetworkTracerouteResolver(Resolver):
     resolver_id = "network-traceroute"
     default_interval = 60
+    schema = {
+        "packet_count": Metric("Probes sent per hop"),
+        "num_hops": Metric("Hops of the path"),
+        "worst_loss": Metric("Highest loss of a hop that answered at all", "percent"),
+        "worst_latency": Metric("Highest mean round trip time of a hop that answered at all", "milliseconds"),
+        "path_hash": Metric("Fingerprint of the hop addresses, changes with the route"),
+        "route_changes_total": Metric("Route changes since the collector started", type="counter"),
+        "hop_latency": Metric("Mean round trip time per hop", "milliseconds", label="hop"),
+        "hop_loss": Metric("Loss per hop", "percent", label="hop"),
+    }
+
+    def __init__(self, config: dict, logger: Logger):
+        super().__init__(config, logger)
+        self.store = TracerouteStore(
+            base_path=config.get("storage_path", BASE_STORAGE_PATH),
+            retention_days=config.get("retention_days", 30),
+            compact_after_days=config.get("compact_after_days", 7),
+            compact_interval=config.get("compact_interval_seconds", 600),
+        )
+        self.store.start_maintenance()
+        self.loss_threshold = config.get("store_loss_threshold", 10.0)
+        self.latency_threshold = config.get("store_latency_threshold", 150.0)
+        self.max_hops = config.get("max_hops", 30)
+        self.engine = config.get("engine", "native")
+        self.count = config.get("packets", 10)
 
     def run(self, server: "Server", last_result: Result | None):
         timestamp = now()
-        if last_result and (timestamp < last_result.timestamp + timedelta(seconds=self.default_interval)):
-            return SkippedRun(self, f"last mtr run < {self.default_interval}s ago")
-
         self.logger.debug(f"Performing traceroute to '{server.hostname}'")
 
-        mtr_result = self._run_mtr(server.hostname)
-        mtr_text = self._format_mtr_text(mtr_result["hops"])
-        file_path = self._store_mtr_output(server.hostname, mtr_text, timestamp)
-        self.logger.debug(f"Stored traceroute at '{file_path}'")
+        address = dns.cache().resolve(server.hostname)
+        if address is None:
+            raise RuntimeError(f"could not resolve '{server.hostname}'")
+
+        mtr_result = self._run_native(address) if self.engine == "native" else self._run_mtr(address, self.count)
+        hops = mtr_result["hops"]
+
+        path_hash = self._path_hash(hops)
+        previous_hash = last_result.metrics.get("path_hash") if last_result else None
+        route_changes = last_result.metrics.get("route_changes_total", 0) if last_result else 0
+        if previous_hash is not None and previous_hash != path_hash:
+            route_changes += 1
+            self.logger.info(f"Route to '{server.hostname}' changed")
+
+        if previous_hash != path_hash or mtr_result["worst_loss"] >= self.loss_threshold or mtr_result["worst_latency"] >= self.latency_threshold:
+            segment_path = self.store.append(
+                self._normalize_server_id(server.hostname),
+                timestamp,
+                'Collected at: ' + timestamp.isoformat() + '\n' + self._format_mtr_text(hops)
+            )
+            self.logger.debug(f"Stored traceroute in '{segment_path}'")
 
         return Result(
             metrics={
@@ -36,11 +77,44 @@ class NetworkTracerouteResolver(Resolver):
                 "num_hops": mtr_result["num_hops"],
                 "worst_loss": mtr_result["worst_loss"],
                 "worst_latency": mtr_result["worst_latency"],
+                "path_hash": path_hash,
+                "route_changes_total": route_changes,
+                "hop_latency": [LabeledMetric(hop["avg"], str(hop["hop"]), "hop") for hop in hops[:self.max_hops]],
+                "hop_loss": [LabeledMetric(hop["loss"], str(hop["hop"]), "hop") for hop in hops[:self.max_hops]],
             },
             timestamp=timestamp,
             resolver=self
         )
 
+    def _run_native(self, host: str):
+        try:
+            trace = icmp.engine().trace_many(
+                [host],
+                count=self.count,
+                interval=self.config.get("interval", 0.25),
+                timeout=self.config.get("timeout", 2.0),
+                max_hops=self.max_hops,
+            )[host]
+        except icmp.TracerouteUnavailable as exception:
+            # without CAP_NET_RAW only mtr, which is setuid or has the capability itself, can trace
+            self.logger.warning(f"Falling back to mtr: {exception}")
+            self.engine = "mtr"
+            return self._run_mtr(host, self.count)
+
+        hops = [
+            {"hop": ttl, "loss": hop.loss, "sent": hop.sent, "avg": hop.avg, "host": hop.host}
+            for ttl, hop in enumerate(trace, 1)
+        ]
+        answered = [hop for hop in hops if hop["loss"] < 100]
+
+        return {
+            "count": self.count,
+            "hops": hops,
+            "num_hops": len(hops),
+            "worst_loss": max((hop["loss"] for hop in answered), default=0.0),
+            "worst_latency": max((hop["avg"] for hop in answered), default=0.0),
+        }
+
     def _run_mtr(self, host: str, count: int = 10):
         try:
             proc = subprocess.run(
@@ -48,8 +122,12 @@ class NetworkTracerouteResolver(Resolver):
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
-                check=True
+                check=True,
+                # mtr sends a round per second, plus some grace for the last replies
+                timeout=count + MTR_GRACE_SECONDS,
             )
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"MTR did not finish within {count + MTR_GRACE_SECONDS} seconds")
         except FileNotFoundError:
             raise RuntimeError("mtr command not found. Install it first (sudo apt install mtr-tiny).")
         except subprocess.CalledProcessError as e:
@@ -88,6 +166,11 @@ class NetworkTracerouteResolver(Resolver):
             "worst_latency": worst_latency,
         }
 
+    def _path_hash(self, hops) -> int:
+        path = "|".join(hop["host"] for hop in hops)
+        # 48 bits, so the gauge value stays exact as float
+        return int.from_bytes(hashlib.blake2b(path.encode(), digest_size=6).digest(), "big")
+
     def _format_mtr_text(self, hops_data):
         hop_w = 3
         loss_w = 5
@@ -117,29 +200,9 @@ class NetworkTracerouteResolver(Resolver):
         return "\n".join(table_lines)
 
     def _normalize_server_id(self, hostname: str) -> str:
-        hostname = hostname.strip().lower()
-
-        if hostname.endswith("."):
-            hostname = hostname[:-1]
-
-        try:
-            hostname = idna.encode(hostname).decode("ascii")
-        except idna.IDNAError as e:
-            raise ValueError(f"Invalid IDN hostname: {hostname}") from e
+        hostname = normalize_hostname(hostname)
 
         if not DOMAIN_RE.match(hostname):
             raise ValueError(f"Unsafe hostname for filesystem use: {hostname}")
 
         return hostname.replace(":", "-")
-
-    def _store_mtr_output(self, server_id: str, text: str, timestamp: datetime) -> str:
-        timestamp_utc = timestamp.astimezone(timezone.utc)
-        dir_path = os.path.join(BASE_STORAGE_PATH, self._normalize_server_id(server_id))
-        file_path = os.path.join(dir_path, f"{timestamp_utc.strftime("%Y-%m-%dT%H-%M-%SZ")}.txt")
-
-        os.makedirs(dir_path, exist_ok=True)
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write('Collected at: ' + timestamp.isoformat() + '\n' + text)
-
-        return file_path
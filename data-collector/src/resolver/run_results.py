@@ -6,6 +6,8 @@ from shared.shared import now
 
 
 class BaseResult:
+    __slots__ = ("timestamp", "resolver")
+
     timestamp: datetime
     resolver: "Resolver"
 
@@ -13,10 +15,10 @@ class BaseResult:
         self.timestamp = now()
         self.resolver = resolver
 
-    pass
-
 
 class Result(BaseResult):
+    __slots__ = ("metrics",)
+
     metrics: Dict[str, float]
 
     def __init__(self, resolver: "Resolver", metrics: Dict[str, float], timestamp: datetime | None = None):
@@ -27,6 +29,8 @@ class Result(BaseResult):
 
 
 class SkippedRun(BaseResult):
+    __slots__ = ("reason",)
+
     def __init__(self, resolver: "Resolver", reason: str):
         super().__init__(resolver)
         self.reason = reason
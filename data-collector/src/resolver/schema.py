@@ -0,0 +1,46 @@
+import re
+from typing import NamedTuple
+
+NAME_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+TYPES = ("gauge", "counter")
+
+
+class Metric(NamedTuple):
+    help: str
+    unit: str = ""
+    type: str = "gauge"
+    # label_name of the LabeledMetric values as exported, None for plain numbers
+    label: str | None = None
+
+    def help_text(self) -> str:
+        return f"{self.help} ({self.unit})" if self.unit else self.help
+
+
+def validate(resolver_id: str, schema: dict[str, Metric]):
+    for name, metric in schema.items():
+        if not isinstance(metric, Metric):
+            raise TypeError(f"{resolver_id}: schema entry '{name}' has to be a Metric")
+        if not NAME_RE.match(name) or (metric.label is not None and not NAME_RE.match(metric.label)):
+            raise TypeError(f"{resolver_id}: invalid metric or label name in '{name}'")
+        if metric.type not in TYPES:
+            raise TypeError(f"{resolver_id}: '{name}' has unknown type '{metric.type}', expected one of {TYPES}")
+        if metric.type == "counter" and not name.endswith("_total"):
+            raise TypeError(f"{resolver_id}: counter '{name}' has to end with _total")
+
+
+def check(resolver_id: str, schema: dict[str, Metric], metrics: dict):
+    # shared.cache imports the results, which import the resolvers
+    from shared.cache import LabeledMetric
+
+    for name, value in metrics.items():
+        metric = schema.get(name)
+        if metric is None:
+            raise ValueError(f"{resolver_id}: metric '{name}' is not declared in the schema")
+
+        for v in value if isinstance(value, (list, tuple)) else (value,):
+            if isinstance(v, LabeledMetric):
+                # declared metrics name their label, the exposition's default name is only for older results
+                if v.label_name != metric.label:
+                    raise ValueError(f"{resolver_id}: '{name}' is labeled {v.label_name!r}, the schema declares {metric.label!r}")
+            elif metric.label is not None or not isinstance(v, (int, float)):
+                raise ValueError(f"{resolver_id}: '{name}' expects {metric.label and 'a LabeledMetric' or 'a number'}, got {v!r}")
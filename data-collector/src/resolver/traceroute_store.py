@@ -0,0 +1,240 @@
+import argparse
+import bisect
+import fcntl
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from shared.shared import logger
+
+logger = logger('traceroute-store')
+
+BASE_STORAGE_PATH = "/storage/traceroutes"
+INDEX_ENTRY = struct.Struct("<dQI")
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+DAY_FORMAT = "%Y-%m-%d"
+MAINTENANCE_INTERVAL = 3600
+
+# per host directory, several stores (the collector's and /probe's resolvers) can write the same files
+_locks: dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+
+
+def _host_lock(host_path: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(host_path), threading.Lock())
+
+
+# one store per storage path is maintained, independent of appends, stable routes are rarely stored
+_maintained: dict[str, "TracerouteStore"] = {}
+
+
+def _maintenance_loop():
+    while True:
+        with _locks_lock:
+            stores = list(_maintained.values())
+        for store in stores:
+            try:
+                store.maintain()
+            except OSError as exception:
+                logger.warning(f"maintaining '{store.base_path}' failed: {exception}")
+        time.sleep(MAINTENANCE_INTERVAL)
+
+
+# per host and UTC day: an append-only segment of zlib-compressed records and an index of (timestamp, offset, length)
+class TracerouteStore:
+    def __init__(self, base_path: str = BASE_STORAGE_PATH, retention_days: int | None = 30,
+                 compact_after_days: int | None = 7, compact_interval: int = 600):
+        self.base_path = base_path
+        self.retention_days = retention_days
+        self.compact_after_days = compact_after_days
+        self.compact_interval = compact_interval
+
+    def start_maintenance(self):
+        with _locks_lock:
+            start = not _maintained
+            _maintained[os.path.abspath(self.base_path)] = self
+        if start:
+            threading.Thread(target=_maintenance_loop, name='traceroute-maintenance', daemon=True).start()
+
+    def _paths(self, host_id: str, day: str) -> tuple[str, str]:
+        base = os.path.join(self.base_path, host_id, day)
+        return base + SEGMENT_SUFFIX, base + INDEX_SUFFIX
+
+    def append(self, host_id: str, timestamp: datetime, text: str) -> str:
+        timestamp_utc = timestamp.astimezone(timezone.utc)
+        day = timestamp_utc.strftime(DAY_FORMAT)
+        segment_path, index_path = self._paths(host_id, day)
+        record = zlib.compress(text.encode("utf-8"))
+
+        with _host_lock(os.path.dirname(segment_path)):
+            os.makedirs(os.path.dirname(segment_path), exist_ok=True)
+
+            with open(segment_path, "ab") as segment:
+                # the collector processes and the publisher may append to the same segment
+                fcntl.flock(segment, fcntl.LOCK_EX)
+                offset = segment.seek(0, os.SEEK_END)
+                segment.write(record)
+                segment.flush()
+
+                with open(index_path, "ab") as index:
+                    index.write(INDEX_ENTRY.pack(timestamp_utc.timestamp(), offset, len(record)))
+
+        return segment_path
+
+    def _read_index(self, index_path: str) -> list[tuple[float, int, int]]:
+        try:
+            with open(index_path, "rb") as index:
+                data = index.read()
+        except FileNotFoundError:
+            return []
+
+        # ignore a torn trailing entry
+        data = data[:len(data) - len(data) % INDEX_ENTRY.size]
+        return list(INDEX_ENTRY.iter_unpack(data))
+
+    def _read_record(self, segment_path: str, offset: int, length: int) -> str:
+        with open(segment_path, "rb") as segment:
+            segment.seek(offset)
+            return zlib.decompress(segment.read(length)).decode("utf-8")
+
+    def entries(self, host_id: str, day: str) -> list[tuple[float, int, int]]:
+        return self._read_index(self._paths(host_id, day)[1])
+
+    def nearest(self, host_id: str, timestamp: datetime) -> tuple[datetime, str] | None:
+        target = timestamp.astimezone(timezone.utc)
+        candidates = []
+
+        for delta in (-1, 0, 1):
+            day = (target + timedelta(days=delta)).strftime(DAY_FORMAT)
+            entries = self.entries(host_id, day)
+            if not entries:
+                continue
+
+            position = bisect.bisect_left(entries, (target.timestamp(),))
+            for neighbour in entries[max(0, position - 1):position + 1]:
+                candidates.append((abs(neighbour[0] - target.timestamp()), day, neighbour))
+
+        if not candidates:
+            return None
+
+        _, day, (entry_timestamp, offset, length) = min(candidates)
+        text = self._read_record(self._paths(host_id, day)[0], offset, length)
+        return datetime.fromtimestamp(entry_timestamp, timezone.utc), text
+
+    def at(self, host_id: str, timestamp: datetime) -> tuple[datetime, str] | None:
+        # the last stored traceroute at or before the timestamp, i.e. the route in effect at that time
+        target = timestamp.astimezone(timezone.utc)
+        target_day = target.strftime(DAY_FORMAT)
+
+        try:
+            names = os.listdir(os.path.join(self.base_path, host_id))
+        except FileNotFoundError:
+            return None
+
+        days = sorted((name[:-len(INDEX_SUFFIX)] for name in names if name.endswith(INDEX_SUFFIX)), reverse=True)
+        for day in days:
+            if day > target_day:
+                continue
+
+            entries = self.entries(host_id, day)
+            position = bisect.bisect_right(entries, target.timestamp(), key=lambda entry: entry[0])
+            if position:
+                entry_timestamp, offset, length = entries[position - 1]
+                text = self._read_record(self._paths(host_id, day)[0], offset, length)
+                return datetime.fromtimestamp(entry_timestamp, timezone.utc), text
+
+        return None
+
+    def maintain(self):
+        today = datetime.now(timezone.utc).date()
+        try:
+            hosts = os.listdir(self.base_path)
+        except FileNotFoundError:
+            return
+
+        for host_id in hosts:
+            host_path = os.path.join(self.base_path, host_id)
+            if os.path.isdir(host_path):
+                with _host_lock(host_path):
+                    self._maintain(host_id, today)
+
+    def _maintain(self, host_id: str, today):
+        host_path = os.path.join(self.base_path, host_id)
+
+        for name in os.listdir(host_path):
+            try:
+                day = datetime.strptime(name[:10], DAY_FORMAT).date()
+            except ValueError:
+                continue
+
+            age = (today - day).days
+            if self.retention_days is not None and age > self.retention_days:
+                # also covers the one-file-per-run .txt traceroutes of older versions
+                os.remove(os.path.join(host_path, name))
+            elif self.compact_after_days is not None and age > self.compact_after_days and name.endswith(SEGMENT_SUFFIX):
+                self._compact(host_id, name[:-len(SEGMENT_SUFFIX)])
+
+    def _compact(self, host_id: str, day: str):
+        segment_path, index_path = self._paths(host_id, day)
+        entries = self._read_index(index_path)
+
+        # the last record per slot, at() has to return the route that was in effect after it
+        kept = []
+        last_slot = None
+        for entry in entries:
+            slot = int(entry[0] // self.compact_interval)
+            if slot == last_slot:
+                kept[-1] = entry
+            else:
+                kept.append(entry)
+                last_slot = slot
+
+        if len(kept) == len(entries):
+            return
+
+        with open(segment_path, "rb") as source:
+            # other collector processes maintain the same files, the first one compacts
+            fcntl.flock(source, fcntl.LOCK_EX)
+            if self._read_index(index_path) != entries:
+                return
+            data = source.read()
+
+            with open(segment_path + ".tmp", "wb") as segment, open(index_path + ".tmp", "wb") as index:
+                for entry_timestamp, offset, length in kept:
+                    index.write(INDEX_ENTRY.pack(entry_timestamp, segment.tell(), length))
+                    segment.write(data[offset:offset + length])
+
+            os.replace(segment_path + ".tmp", segment_path)
+            os.replace(index_path + ".tmp", index_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Print the route in effect at a point in time")
+    parser.add_argument("host", help="normalized hostname, i.e. the directory name below the storage path")
+    parser.add_argument("timestamp", nargs="?", help="ISO 8601 timestamp, defaults to now")
+    parser.add_argument("--path", default=BASE_STORAGE_PATH)
+    parser.add_argument("--nearest", action="store_true", help="print the closest traceroute, also if it was stored later")
+    args = parser.parse_args(argv)
+
+    timestamp = datetime.fromisoformat(args.timestamp) if args.timestamp else datetime.now(timezone.utc)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.astimezone()
+
+    store = TracerouteStore(args.path)
+    found = store.nearest(args.host, timestamp) if args.nearest else store.at(args.host, timestamp)
+    if found is None:
+        print(f"no traceroute stored for '{args.host}' around {timestamp.isoformat()}", file=sys.stderr)
+        return 1
+
+    print(found[1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+from breaker import CircuitBreaker
+from shared.config import Server
+
+
+class Job:
+    def __init__(self, server: Server, resolver, interval: float):
+        self.server = server
+        self.resolver = resolver
+        self.interval = interval
+        self.due: float = 0.0
+        self.future: Future | None = None
+        self.cancelled = False
+        self.breaker: CircuitBreaker | None = None
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.server.hostname, self.resolver.resolver_id
+
+    @property
+    def running(self) -> bool:
+        return self.future is not None and not self.future.done()
+
+    def phase(self) -> float:
+        # stable offset within the interval, spreads the jobs evenly instead of firing all at once
+        return zlib.crc32('/'.join(self.key).encode()) / 2 ** 32 * self.interval
+
+
+class Scheduler:
+    def __init__(self):
+        self.queue: list[tuple[float, int, Job]] = []
+        self.counter = itertools.count()
+        # wakes wait_due for jobs added while it waits, e.g. the first ones after an empty config
+        self.condition = threading.Condition()
+
+    def add(self, job: Job, due: float | None = None):
+        job.due = due if due is not None else time.monotonic() + job.phase()
+        with self.condition:
+            heapq.heappush(self.queue, (job.due, next(self.counter), job))
+            self.condition.notify()
+
+    def reschedule(self, job: Job):
+        job.due += job.interval
+
+        current = time.monotonic()
+        if job.due <= current:
+            # skip the slots we missed, but stay on the job's original phase
+            job.due += math.ceil((current - job.due) / job.interval) * job.interval
+
+        with self.condition:
+            heapq.heappush(self.queue, (job.due, next(self.counter), job))
+            self.condition.notify()
+
+    def wait_due(self, timeout: float | None = None) -> list[Job]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        with self.condition:
+            while True:
+                current = time.monotonic()
+                if self.queue and self.queue[0][0] <= current:
+                    break
+                if deadline is not None and current >= deadline:
+                    return []
+
+                # without jobs and a timeout there is nothing to do until one is added
+                delay = self.queue[0][0] - current if self.queue else None
+                if deadline is not None:
+                    delay = deadline - current if delay is None else min(delay, deadline - current)
+                self.condition.wait(delay)
+
+            jobs = []
+            while self.queue and self.queue[0][0] <= current:
+                job = heapq.heappop(self.queue)[2]
+                # removed by a config reload, dropped lazily instead of searching the heap
+                if not job.cancelled:
+                    jobs.append(job)
+
+        return jobs
@@ -1,24 +1,105 @@
-from collections import defaultdict
+import threading
 from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Iterator, Mapping, NamedTuple
 
 from resolver.run_results import Result
 
+MAX_TOMBSTONES = 1024
+
 
 @dataclass(frozen=True)
 class LabeledMetric:
     value: float
     label: str
+    label_name: str | None = None
+
+
+class Entry(NamedTuple):
+    generation: int
+    result: Result
+
+
+class Snapshot:
+    __slots__ = ("generation", "servers", "removed")
+
+    def __init__(self, generation: int, servers: Mapping[str, Mapping[str, Entry]], removed: tuple = ()):
+        self.generation = generation
+        self.servers = servers
+        # (generation, (server_id, resolver_id)) of removed results, so incremental readers can drop them too
+        self.removed: tuple[tuple[int, tuple[str, str]], ...] = removed
+
+    def get(self, server_id: str, resolver_id: str) -> Result | None:
+        entry = self.servers.get(server_id, {}).get(resolver_id, None)
+        return entry.result if entry is not None else None
+
+    def entries(self) -> Iterator[tuple[tuple[str, str], Entry]]:
+        for server_id, resolvers in self.servers.items():
+            for resolver_id, entry in resolvers.items():
+                yield (server_id, resolver_id), entry
+
+    def changed_since(self, generation: int) -> list[tuple[tuple[str, str], Entry]]:
+        if generation >= self.generation:
+            return []
+        return [(key, entry) for key, entry in self.entries() if entry.generation > generation]
+
+    def removed_since(self, generation: int) -> list[tuple[str, str]]:
+        return [key for removed, key in self.removed if removed > generation]
 
 
 class ResultCache:
     def __init__(self):
-        self.data = defaultdict(dict)
+        self.lock = threading.Lock()
+        self._snapshot = Snapshot(0, MappingProxyType({}))
+
+    @property
+    def generation(self) -> int:
+        return self._snapshot.generation
+
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
 
     def update(self, server_id: str, resolver_id: str, result: Result):
-        self.data[server_id][resolver_id] = result
+        # copy-on-write, readers keep working on the snapshot they already hold
+        with self.lock:
+            current = self._snapshot
+            generation = current.generation + 1
+
+            resolvers = dict(current.servers.get(server_id, {}))
+            resolvers[resolver_id] = Entry(generation, result)
+
+            servers = dict(current.servers)
+            servers[server_id] = MappingProxyType(resolvers)
+
+            self._snapshot = Snapshot(generation, MappingProxyType(servers), current.removed)
 
-    def get_all(self):
-        return self.data
+    def remove(self, server_id: str, resolver_id: str):
+        with self.lock:
+            current = self._snapshot
+            if resolver_id not in current.servers.get(server_id, {}):
+                return
+
+            generation = current.generation + 1
+            resolvers = dict(current.servers[server_id])
+            del resolvers[resolver_id]
+
+            servers = dict(current.servers)
+            if resolvers:
+                servers[server_id] = MappingProxyType(resolvers)
+            else:
+                del servers[server_id]
+
+            removed = current.removed[-MAX_TOMBSTONES + 1:] + ((generation, (server_id, resolver_id)),)
+            self._snapshot = Snapshot(generation, MappingProxyType(servers), removed)
+
+    def get_all(self) -> dict[str, dict[str, Result]]:
+        return {
+            server_id: {resolver_id: entry.result for resolver_id, entry in resolvers.items()}
+            for server_id, resolvers in self._snapshot.servers.items()
+        }
 
     def get(self, server_id: str, resolver_id: str) -> Result | None:
-        return self.data.get(server_id, {}).get(resolver_id, None)
+        return self._snapshot.get(server_id, resolver_id)
+
+    def changed_since(self, generation: int) -> list[tuple[tuple[str, str], Entry]]:
+        return self._snapshot.changed_since(generation)
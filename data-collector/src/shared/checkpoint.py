@@ -0,0 +1,179 @@
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+from resolver.run_results import Result
+from shared.cache import ResultCache, LabeledMetric
+from shared.config import Config
+from shared.shared import logger, get_local_timezone
+
+logger = logger('checkpoint')
+
+MAGIC = b"SMRC"
+VERSION = 1
+MMAP_THRESHOLD = 1024 * 1024
+
+HEADER = struct.Struct("<4sHI")
+STRING = struct.Struct("<H")
+ENTRY = struct.Struct("<dH")
+KIND = struct.Struct("<B")
+FLOAT = struct.Struct("<d")
+
+KIND_FLOAT = 0
+KIND_LABELED = 1
+KIND_LIST = 2
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return STRING.pack(len(encoded)) + encoded
+
+
+def _labeled(value: LabeledMetric) -> bytes:
+    return FLOAT.pack(value.value) + _string(str(value.label)) + _string(value.label_name or "")
+
+
+def encode_entry(server_id: str, resolver_id: str, timestamp: float, metrics: dict) -> bytes:
+    out = bytearray(_string(server_id) + _string(resolver_id) + ENTRY.pack(timestamp, len(metrics)))
+
+    for name, value in metrics.items():
+        out += _string(name)
+        if isinstance(value, LabeledMetric):
+            out += KIND.pack(KIND_LABELED) + _labeled(value)
+        elif isinstance(value, (list, tuple)):
+            out += KIND.pack(KIND_LIST) + STRING.pack(len(value)) + b"".join(_labeled(v) for v in value)
+        else:
+            out += KIND.pack(KIND_FLOAT) + FLOAT.pack(float(value))
+
+    return bytes(out)
+
+
+def encode(cache: ResultCache) -> bytes:
+    entries = list(cache.snapshot().entries())
+    out = bytearray(HEADER.pack(MAGIC, VERSION, len(entries)))
+    for (server_id, resolver_id), entry in entries:
+        out += encode_entry(server_id, resolver_id, entry.result.timestamp.timestamp(), entry.result.metrics)
+    return bytes(out)
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def unpack(self, structure: struct.Struct):
+        values = structure.unpack_from(self.data, self.position)
+        self.position += structure.size
+        return values
+
+    def string(self) -> str:
+        (length,) = self.unpack(STRING)
+        value = bytes(self.data[self.position:self.position + length]).decode("utf-8")
+        self.position += length
+        return value
+
+    def labeled(self) -> LabeledMetric:
+        (value,) = self.unpack(FLOAT)
+        label = self.string()
+        return LabeledMetric(value, label, self.string() or None)
+
+    def entry(self) -> tuple[str, str, float, dict]:
+        server_id = self.string()
+        resolver_id = self.string()
+        timestamp, metric_count = self.unpack(ENTRY)
+
+        metrics = {}
+        for _ in range(metric_count):
+            name = self.string()
+            (kind,) = self.unpack(KIND)
+            if kind == KIND_LABELED:
+                metrics[name] = self.labeled()
+            elif kind == KIND_LIST:
+                (length,) = self.unpack(STRING)
+                metrics[name] = [self.labeled() for _ in range(length)]
+            else:
+                metrics[name] = self.unpack(FLOAT)[0]
+
+        return server_id, resolver_id, timestamp, metrics
+
+
+def decode_entry(data) -> tuple[str, str, float, dict]:
+    return _Reader(data).entry()
+
+
+def decode(data) -> list[tuple[str, str, float, dict]]:
+    reader = _Reader(data)
+    magic, version, count = reader.unpack(HEADER)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"unsupported checkpoint format {magic!r} v{version}")
+
+    return [reader.entry() for _ in range(count)]
+
+
+def save(path: str, cache: ResultCache):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(encode(cache))
+    os.replace(path + ".tmp", path)
+
+
+def load(config: Config, cache: ResultCache) -> int:
+    settings = config.checkpoint
+    if settings is None:
+        return 0
+
+    path = settings["path"]
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    entries = decode(data)
+            else:
+                entries = decode(f.read())
+    except FileNotFoundError:
+        return 0
+    except (ValueError, struct.error, UnicodeDecodeError) as exception:
+        logger.warning(f"ignoring unreadable checkpoint '{path}': {exception}")
+        return 0
+
+    resolvers = {(server.hostname, resolver.resolver_id): resolver for server in config.servers for resolver in server.resolvers}
+    cutoff = time.time() - settings["max_age_seconds"]
+    timezone = get_local_timezone()
+
+    loaded = 0
+    for server_id, resolver_id, timestamp, metrics in entries:
+        resolver = resolvers.get((server_id, resolver_id))
+        if resolver is None or timestamp < cutoff:
+            continue
+
+        cache.update(server_id, resolver_id, Result(resolver, metrics, datetime.fromtimestamp(timestamp, timezone)))
+        loaded += 1
+
+    logger.info(f"restored {loaded} of {len(entries)} results from '{path}'")
+    return loaded
+
+
+def run(config: Config, cache: ResultCache):
+    settings = config.checkpoint
+    generation = cache.generation
+
+    while True:
+        time.sleep(settings["interval_seconds"])
+        if cache.generation == generation:
+            continue
+
+        generation = cache.generation
+        try:
+            save(settings["path"], cache)
+        except OSError as exception:
+            logger.warning(f"writing checkpoint '{settings['path']}' failed: {exception}")
+
+
+def invoke(config: Config, cache: ResultCache):
+    try:
+        run(config, cache)
+    except BaseException as exception:
+        logger.exception(exception)
@@ -1,6 +1,7 @@
 import os
 import yaml
 from resolver.resolver import Resolver
+from shared.sharding import HashRing
 from shared.shared import Printable
 
 
@@ -24,7 +25,10 @@ class ConfigDict(dict):
         return super().__getitem__(key)
 
 class Config:
-    def __init__(self, path: str):
+    def __init__(self, path: str, worker: tuple[int, int] | None = None):
+        self.path = path
+        # (worker, workers) when running as one of several collector processes
+        self.worker = worker
         with open(path) as f:
             self.raw = yaml.safe_load(f)
             self.raw = self._expand_env(self.raw)
@@ -52,8 +56,20 @@ class Config:
     @property
     def servers(self) -> list[Server]:
         if not self._servers:
+            sharding = self.sharding
+            ring = HashRing(sharding[1]) if sharding else None
+            worker_ring = HashRing(self.worker[1], salt="worker-") if self.worker else None
+
             for s in self.config.servers:
-                resolvers = [Resolver.create('network', {}), Resolver.create('network-traceroute', {})]
+                if ring is not None and ring.shard(s.hostname) != sharding[0]:
+                    continue
+                if worker_ring is not None and worker_ring.shard(s.hostname) != self.worker[0]:
+                    continue
+
+                resolvers = [
+                    Resolver.create('network', self.resolver_settings('network')),
+                    Resolver.create('network-traceroute', self.resolver_settings('network-traceroute')),
+                ]
                 for rid, rconf in s.get("resolvers", {}).items():
                     resolver = Resolver.create(rid, rconf)
                     resolvers.append(resolver)
@@ -64,3 +80,115 @@ class Config:
     @property
     def run_interval(self) -> int:
         return self.raw["global"]["run_interval_seconds"]
+
+    @property
+    def max_workers(self) -> int:
+        return self.raw["global"].get("max_workers", 1)
+
+    @property
+    def metrics_ttl(self) -> int | None:
+        return self.raw["global"].get("metrics_ttl_seconds", 600)
+
+    @property
+    def max_series_per_metric(self) -> int | None:
+        return self.raw["global"].get("max_series_per_metric", 10000)
+
+    @property
+    def debug_endpoints(self) -> bool:
+        return bool(self.raw["global"].get("debug_endpoints", False))
+
+    @property
+    def remote_write(self) -> dict | None:
+        settings = self.raw["global"].get("remote_write")
+        return settings if settings and settings.get("url") else None
+
+    @property
+    def checkpoint(self) -> dict | None:
+        settings = self.raw["global"].get("checkpoint") or {}
+        if not settings.get("enabled", True):
+            return None
+
+        return {
+            "path": settings.get("path", "/storage/result-cache.bin"),
+            "interval_seconds": settings.get("interval_seconds", 60),
+            "max_age_seconds": settings.get("max_age_seconds", 600),
+        }
+
+    @property
+    def probe(self) -> dict | None:
+        settings = self.raw["global"].get("probe") or {}
+        if not settings.get("enabled", False):
+            return None
+
+        return {
+            "max_age_seconds": settings.get("max_age_seconds", 10),
+            "timeout_seconds": settings.get("timeout_seconds", 30),
+            "max_concurrency": settings.get("max_concurrency", 16),
+        }
+
+    @property
+    def sharding(self) -> tuple[int, int] | None:
+        shards = int((self.raw["global"].get("sharding") or {}).get("shards", 1))
+        if shards <= 1:
+            return None
+
+        # all replicas share the config.yml, so the replica's own shard is taken from its environment
+        shard = int(os.environ.get("COLLECTOR_SHARD", 0))
+        if not 0 <= shard < shards:
+            raise ValueError(f"COLLECTOR_SHARD has to be between 0 and {shards - 1}, got {shard}")
+
+        return shard, shards
+
+    @property
+    def processes(self) -> dict | None:
+        settings = self.raw["global"].get("processes") or {}
+        if settings.get("workers", 0) <= 0:
+            return None
+
+        return {
+            "workers": settings["workers"],
+            "slots": settings.get("slots", 1024),
+            "slot_bytes": settings.get("slot_bytes", 4096),
+        }
+
+    @property
+    def circuit_breaker(self) -> dict | None:
+        settings = self.raw["global"].get("circuit_breaker") or {}
+        if settings.get("failures", 3) <= 0:
+            return None
+
+        return {
+            "failures": settings.get("failures", 3),
+            "backoff_seconds": settings.get("backoff_seconds", 30),
+            "max_backoff_seconds": settings.get("max_backoff_seconds", 600),
+        }
+
+    @property
+    def logging(self) -> dict:
+        settings = self.raw["global"].get("logging") or {}
+        return {
+            "format": settings.get("format", "text"),
+            "level": settings.get("level", "INFO"),
+            "rate_limit_seconds": settings.get("rate_limit_seconds", 60),
+        }
+
+    @property
+    def dns(self) -> dict:
+        settings = self.raw["global"].get("dns") or {}
+        return {
+            "ttl": settings.get("ttl_seconds", 300),
+            "max_stale": settings.get("max_stale_seconds", 86400),
+        }
+
+    @property
+    def reload_interval(self) -> int | None:
+        return self.raw["global"].get("reload_interval_seconds", 10)
+
+    def resolver_settings(self, resolver_id: str) -> dict:
+        return (self.raw["global"].get("resolvers") or {}).get(resolver_id) or {}
+
+    def resolver_interval(self, resolver: Resolver) -> int:
+        return self.resolver_settings(resolver.resolver_id).get(
+            "interval_seconds",
+            resolver.default_interval or self.run_interval
+        )
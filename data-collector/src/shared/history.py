@@ -0,0 +1,41 @@
+import bisect
+import math
+from array import array
+
+
+# raw samples of the last runs in fixed memory, a timestamp and a value per sample, NaN marks a lost sample
+class RingBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.position = 0
+        self.count = 0
+
+    def extend(self, timestamp: float, values):
+        for value in values:
+            self.times[self.position] = timestamp
+            self.values[self.position] = value
+            self.position = (self.position + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def window(self, seconds: float, current: float) -> array:
+        if self.count < self.capacity:
+            times, values = self.times[:self.count], self.values[:self.count]
+        else:
+            times = self.times[self.position:] + self.times[:self.position]
+            values = self.values[self.position:] + self.values[:self.position]
+
+        return values[bisect.bisect_left(times, current - seconds):]
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    # linear interpolation between the closest ranks, like numpy's default
+    rank = (len(ordered) - 1) * q
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def window_label(seconds: int) -> str:
+    return f"{seconds // 60}m" if seconds % 60 == 0 else f"{seconds}s"
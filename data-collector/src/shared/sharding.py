@@ -0,0 +1,30 @@
+import bisect
+import hashlib
+
+from shared.shared import normalize_hostname
+
+VIRTUAL_NODES = 160
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def shard_key(hostname: str) -> str:
+    try:
+        return normalize_hostname(hostname)
+    except ValueError:
+        return hostname.strip().lower().rstrip(".")
+
+
+# consistent hashing, adding or removing a shard only moves the servers of its share of the ring
+class HashRing:
+    def __init__(self, shards: int, virtual_nodes: int = VIRTUAL_NODES, salt: str = ""):
+        # a salt gives an independent ring, e.g. to split a shard again between worker processes
+        points = sorted((_hash(f"{salt}shard-{shard}-{node}"), shard) for shard in range(shards) for node in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def shard(self, hostname: str) -> int:
+        position = bisect.bisect(self.hashes, _hash(shard_key(hostname)))
+        return self.shards[position % len(self.shards)]
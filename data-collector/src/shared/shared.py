@@ -1,11 +1,17 @@
+import functools
+import json
 import logging
 import os
+import queue
 import re
 import time
 from datetime import datetime
 from logging import LogRecord
+from logging.handlers import QueueHandler, QueueListener
 from zoneinfo import ZoneInfo
 
+import idna
+
 
 class LogFormatter(logging.Formatter):
     @staticmethod
@@ -14,7 +20,7 @@ class LogFormatter(logging.Formatter):
         matches = re.findall(pattern, string)
         return len(matches)
 
-    def format(self, record: LogRecord) -> str:
+    def _sanitize(self, record: LogRecord):
         if record.args:
             safe_args = []
             for arg in record.args:
@@ -33,9 +39,16 @@ class LogFormatter(logging.Formatter):
         except BaseException:
             record.msg = f'<non-stringable: {type(record.msg).__name__}>'
 
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            record.msg = f"{record.msg} (suppressed {suppressed} identical messages)"
+
         required_placeholders = max(0, len(record.args) - self._count_placeholders_in_string(record.msg))
         record.msg = record.msg + ' ' + (', '.join(['%s'] * required_placeholders))
 
+    def format(self, record: LogRecord) -> str:
+        self._sanitize(record)
+
         try:
             return super().format(record)
         except BaseException as exception:
@@ -49,7 +62,76 @@ class LogFormatter(logging.Formatter):
             return 'LOGGING ERROR: ' + message + str(record)
 
 
+class JsonFormatter(LogFormatter):
+    FIELDS = ('server_id', 'resolver_id', 'suppressed')
+
+    def format(self, record: LogRecord) -> str:
+        self._sanitize(record)
+
+        try:
+            message = record.getMessage().rstrip()
+        except BaseException as exception:
+            message = f'LOGGING ERROR: {exception!r} {record.msg!r}'
+
+        entry = {
+            'time': datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': message,
+        }
+        for field in self.FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+# lets the first of a series of similar warnings and errors through and counts the rest,
+# e.g. the same resolver failing for the same server every cycle
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.seen: dict[tuple, list] = {}
+
+    @staticmethod
+    def _key(record: LogRecord) -> tuple:
+        if hasattr(record, 'server_id'):
+            return record.name, record.levelno, record.server_id, getattr(record, 'resolver_id', None)
+        exception = type(record.exc_info[1]) if record.exc_info else None
+        return record.name, record.levelno, str(record.msg), exception
+
+    def filter(self, record: LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+
+        current = time.monotonic()
+        key = self._key(record)
+        state = self.seen.get(key)
+        if state is not None and current < state[0]:
+            state[1] += 1
+            return False
+
+        if state is not None and state[1]:
+            record.suppressed = state[1]
+        self.seen[key] = [current + self.interval, 0]
+
+        if len(self.seen) > 10000:
+            self.seen = {k: v for k, v in self.seen.items() if v[0] > current or v[1]}
+        return True
+
+
+# hands the record over as it is, formatting happens on the listener thread instead of the caller's
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: LogRecord) -> LogRecord:
+        return record
+
+
 __logger_configured = None
+__queue_listener: QueueListener | None = None
 
 
 def logger(name: str = None):
@@ -64,6 +146,38 @@ def logger(name: str = None):
     return logging.getLogger(name)
 
 
+def configure_logging(format: str = 'text', level: str = 'INFO', rate_limit_seconds: float = 60):
+    global __queue_listener
+
+    if format == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = LogFormatter(u'%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    if rate_limit_seconds:
+        stream_handler.addFilter(RateLimitFilter(rate_limit_seconds))
+
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    __queue_listener = QueueListener(log_queue, stream_handler)
+    __queue_listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level.upper())
+
+
+def stop_logging():
+    # writes out what is still queued, call it before terminating the process
+    global __queue_listener
+
+    if __queue_listener is not None:
+        __queue_listener.stop()
+        __queue_listener = None
+
+
 class Printable:
     def __str__(self):
         attributes = ', '.join(f"{key}={value}" for key, value in self.__dict__.items())
@@ -118,3 +232,16 @@ def get_local_timezone() -> ZoneInfo:
 def now() -> datetime:
     tz = get_local_timezone()
     return datetime.now(tz)
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_hostname(hostname: str) -> str:
+    hostname = hostname.strip().lower()
+
+    if hostname.endswith("."):
+        hostname = hostname[:-1]
+
+    try:
+        return idna.encode(hostname).decode("ascii")
+    except idna.IDNAError as e:
+        raise ValueError(f"Invalid IDN hostname: {hostname}") from e
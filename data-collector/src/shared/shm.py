@@ -0,0 +1,203 @@
+import struct
+import time
+from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
+
+from prometheus_client import Counter
+
+from resolver.run_results import Result
+from shared.cache import ResultCache
+from shared.checkpoint import encode_entry, decode_entry
+from shared.shared import logger, get_local_timezone
+
+logger = logger('shm')
+
+MAGIC = b"SMSM"
+VERSION = 1
+
+# region: header, then one partition per worker process with its generation and its slots
+HEADER = struct.Struct("<4sHHII")
+# generation and number of used slots of a partition
+PARTITION = struct.Struct("<QI")
+PARTITION_SIZE = 64
+# seqlock sequence, generation, state and payload length of a slot
+SLOT = struct.Struct("<QQBI")
+
+STATE_EMPTY = 0
+STATE_RESULT = 1
+STATE_REMOVED = 2
+
+# a freed slot is only reused after the publisher had the chance to see the removal
+SLOT_REUSE_DELAY = 60
+
+SLOTS_EXHAUSTED = Counter(
+    "collector_shm_slots_exhausted",
+    "Results not published because the worker's shared memory partition was full or the result larger than slot_bytes",
+)
+
+
+def region_size(workers: int, slots: int, slot_bytes: int) -> int:
+    return HEADER.size + workers * (PARTITION_SIZE + slots * (SLOT.size + slot_bytes))
+
+
+def create(workers: int, slots: int, slot_bytes: int) -> SharedMemory:
+    memory = SharedMemory(create=True, size=region_size(workers, slots, slot_bytes))
+    memory.buf[:HEADER.size] = HEADER.pack(MAGIC, VERSION, workers, slots, slot_bytes)
+    return memory
+
+
+class _Layout:
+    def __init__(self, memory: SharedMemory):
+        self.memory = memory
+        self.buffer = memory.buf
+        magic, version, self.workers, self.slots, self.slot_bytes = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported shared memory layout {magic!r} v{version}")
+
+    def partition(self, worker: int) -> int:
+        return HEADER.size + worker * (PARTITION_SIZE + self.slots * (SLOT.size + self.slot_bytes))
+
+    def slot(self, worker: int, index: int) -> int:
+        return self.partition(worker) + PARTITION_SIZE + index * (SLOT.size + self.slot_bytes)
+
+
+# the ResultCache of a collector process, every change is also written to its partition of the shared memory
+class SharedResultCache(ResultCache):
+    def __init__(self, memory: SharedMemory, worker: int):
+        super().__init__()
+        self.layout = _Layout(memory)
+        self.worker = worker
+        self.slots: dict[tuple[str, str], int] = {}
+        self.free: list[tuple[float, int]] = []
+        self.next_slot = 0
+        self.unpublished: set[tuple[str, str]] = set()
+        # continue the generations of a previous process of this worker, the reader ignores older ones
+        self.partition_generation, used = PARTITION.unpack_from(self.layout.buffer, self.layout.partition(worker))
+        self._reset(used)
+
+    def _reset(self, used: int):
+        # the results of a previous process of this worker are unknown to this one, so the reader removes them,
+        # their slots are reused once it had the chance to see that
+        removed = 0
+        for index in range(used):
+            offset = self.layout.slot(self.worker, index)
+            _, _, state, length = SLOT.unpack_from(self.layout.buffer, offset)
+            if state == STATE_RESULT:
+                self._write(index, STATE_REMOVED, bytes(self.layout.buffer[offset + SLOT.size:offset + SLOT.size + length]))
+                removed += 1
+            self.free.append((time.monotonic() + SLOT_REUSE_DELAY, index))
+        self.next_slot = used
+        if removed:
+            logger.info(f"removed {removed} results of the previous process of worker {self.worker}")
+
+    def _allocate(self, key: tuple[str, str]) -> int | None:
+        if key in self.slots:
+            return self.slots[key]
+
+        if self.free and self.free[0][0] <= time.monotonic():
+            index = self.free.pop(0)[1]
+        elif self.next_slot < self.layout.slots:
+            index = self.next_slot
+            self.next_slot += 1
+        else:
+            return None
+
+        self.slots[key] = index
+        return index
+
+    def _write(self, index: int, state: int, payload: bytes):
+        buffer = self.layout.buffer
+        offset = self.layout.slot(self.worker, index)
+        sequence = SLOT.unpack_from(buffer, offset)[0]
+        self.partition_generation += 1
+
+        # odd while writing, the reader retries when the sequence changed in between
+        SLOT.pack_into(buffer, offset, sequence + 1, 0, STATE_EMPTY, 0)
+        buffer[offset + SLOT.size:offset + SLOT.size + len(payload)] = payload
+        SLOT.pack_into(buffer, offset, sequence + 2, self.partition_generation, state, len(payload))
+        PARTITION.pack_into(buffer, self.layout.partition(self.worker), self.partition_generation, self.next_slot)
+
+    def update(self, server_id: str, resolver_id: str, result: Result):
+        super().update(server_id, resolver_id, result)
+
+        key = (server_id, resolver_id)
+        payload = encode_entry(server_id, resolver_id, result.timestamp.timestamp(), result.metrics)
+        with self.lock:
+            index = self._allocate(key) if len(payload) <= self.layout.slot_bytes else None
+            if index is None:
+                SLOTS_EXHAUSTED.inc()
+                if key not in self.unpublished:
+                    self.unpublished.add(key)
+                    logger.warning(f"no shared memory slot for {resolver_id} of {server_id} ({len(payload)} bytes), raise slots or slot_bytes")
+                return
+
+            self.unpublished.discard(key)
+            self._write(index, STATE_RESULT, payload)
+
+    def remove(self, server_id: str, resolver_id: str):
+        super().remove(server_id, resolver_id)
+
+        with self.lock:
+            index = self.slots.pop((server_id, resolver_id), None)
+            if index is None:
+                return
+            self._write(index, STATE_REMOVED, encode_entry(server_id, resolver_id, 0.0, {}))
+            self.free.append((time.monotonic() + SLOT_REUSE_DELAY, index))
+
+
+# mirrors the partitions of all collector processes into the publisher's ResultCache
+class SharedResultReader:
+    def __init__(self, memory: SharedMemory, cache: ResultCache):
+        self.layout = _Layout(memory)
+        self.cache = cache
+        self.partitions = [0] * self.layout.workers
+        self.seen: dict[tuple[int, int], int] = {}
+        self.timezone = get_local_timezone()
+
+    def _read(self, offset: int) -> tuple[int, int, bytes] | None:
+        buffer = self.layout.buffer
+        for _ in range(100):
+            sequence, generation, state, length = SLOT.unpack_from(buffer, offset)
+            if sequence % 2:
+                continue
+            payload = bytes(buffer[offset + SLOT.size:offset + SLOT.size + length])
+            if SLOT.unpack_from(buffer, offset)[0] == sequence:
+                return generation, state, payload
+        return None
+
+    def sync(self) -> int:
+        changes = 0
+        for worker in range(self.layout.workers):
+            generation, used = PARTITION.unpack_from(self.layout.buffer, self.layout.partition(worker))
+            if generation == self.partitions[worker]:
+                continue
+
+            complete = True
+            for index in range(used):
+                slot = self._read(self.layout.slot(worker, index))
+                if slot is None:
+                    complete = False
+                    continue
+
+                slot_generation, state, payload = slot
+                if state == STATE_EMPTY or slot_generation <= self.seen.get((worker, index), 0):
+                    continue
+
+                self.seen[(worker, index)] = slot_generation
+                server_id, resolver_id, timestamp, metrics = decode_entry(payload)
+                if state == STATE_REMOVED:
+                    self.cache.remove(server_id, resolver_id)
+                else:
+                    self.cache.update(server_id, resolver_id, Result(None, metrics, datetime.fromtimestamp(timestamp, self.timezone)))
+                changes += 1
+
+            # a slot that was being written is picked up on the next sync
+            if complete:
+                self.partitions[worker] = generation
+
+        return changes
+
+    def run(self, interval: float):
+        while True:
+            self.sync()
+            time.sleep(interval)
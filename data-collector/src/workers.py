@@ -0,0 +1,115 @@
+import atexit
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+
+from prometheus_client import REGISTRY
+from prometheus_client.multiprocess import MultiProcessCollector
+from prometheus_client.registry import Collector
+
+import collector
+from resolver import dns
+from resolver.resolvers import hll_crcon
+from shared import checkpoint, shm
+from shared.cache import ResultCache
+from shared.config import Config
+from shared.shared import logger, configure_logging
+
+logger = logger('workers')
+
+SYNC_INTERVAL = 0.25
+SUPERVISE_INTERVAL = 5
+
+# recorded in the collector processes, the publisher only serves their sum
+WORKER_METRICS = (
+    collector.RUN_DURATION,
+    collector.RUNS,
+    collector.OVERRUNS,
+    collector.CYCLE_DURATION,
+    collector.CYCLE_LAG,
+    collector.CIRCUIT_STATE,
+    hll_crcon.REQUESTS,
+    dns.LOOKUPS,
+    shm.SLOTS_EXHAUSTED,
+)
+
+
+class WorkerMetricsCollector(Collector):
+    def __init__(self, path: str):
+        self.source = MultiProcessCollector(None, path)
+        self.names = {metric._name for metric in WORKER_METRICS}
+
+    def collect(self):
+        # the other modules are imported by the workers as well, their metrics are still served by this process
+        return [family for family in self.source.collect() if family.name in self.names]
+
+
+def work(config_path: str, worker: int, workers: int, memory_name: str):
+    config = Config(config_path, (worker, workers))
+    configure_logging(**config.logging)
+    memory = SharedMemory(name=memory_name, track=False)
+    cache = shm.SharedResultCache(memory, worker)
+
+    if config.checkpoint:
+        checkpoint.load(config, cache)
+
+    collector.DataCollector(config, cache).run()
+
+
+class Workers:
+    def __init__(self, config: Config, cache: ResultCache):
+        self.config = config
+        self.cache = cache
+        self.settings = config.processes
+        self.context = multiprocessing.get_context("spawn")
+        self.processes: list[multiprocessing.Process | None] = [None] * self.settings["workers"]
+
+        self.memory = shm.create(self.settings["workers"], self.settings["slots"], self.settings["slot_bytes"])
+        atexit.register(self.memory.unlink)
+
+        # spawned processes import prometheus_client again and then record into files in this directory
+        self.metrics_path = tempfile.mkdtemp(prefix="prometheus-")
+        atexit.register(shutil.rmtree, self.metrics_path, True)
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = self.metrics_path
+
+        for metric in WORKER_METRICS:
+            REGISTRY.unregister(metric)
+        REGISTRY.register(WorkerMetricsCollector(self.metrics_path))
+
+    def _spawn(self, worker: int):
+        process = self.context.Process(
+            target=work,
+            args=(self.config.path, worker, len(self.processes), self.memory.name),
+            name=f"data-collector-{worker}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[worker] = process
+
+    def supervise(self):
+        while True:
+            for worker, process in enumerate(self.processes):
+                if not process.is_alive():
+                    logger.error(f"collector process {worker} exited with {process.exitcode}, restarting it")
+                    self._spawn(worker)
+            time.sleep(SUPERVISE_INTERVAL)
+
+    def run(self):
+        for worker in range(len(self.processes)):
+            self._spawn(worker)
+        logger.info(f"started {len(self.processes)} collector processes")
+
+        reader = shm.SharedResultReader(self.memory, self.cache)
+        threading.Thread(target=reader.run, args=(SYNC_INTERVAL,), name='shm-reader', daemon=True).start()
+        self.supervise()
+
+
+def invoke(config: Config, cache: ResultCache):
+    try:
+        Workers(config, cache).run()
+    except BaseException as exception:
+        logger.exception(exception)
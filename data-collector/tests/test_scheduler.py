@@ -0,0 +1,50 @@
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import shared.config  # noqa: F401, resolves the import order of the resolver package
+from scheduler import Job, Scheduler
+
+
+def job(hostname: str) -> Job:
+    return Job(SimpleNamespace(hostname=hostname), SimpleNamespace(resolver_id="network"), 10)
+
+
+class WaitDueTest(unittest.TestCase):
+    def test_empty_queue_blocks_until_a_job_is_added(self):
+        scheduler = Scheduler()
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(scheduler.wait_due()), daemon=True)
+        waiter.start()
+
+        time.sleep(0.2)
+        self.assertTrue(waiter.is_alive(), "wait_due returned on an empty queue without a timeout")
+
+        added = job("a")
+        scheduler.add(added, time.monotonic())
+        waiter.join(1)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(result, [[added]])
+
+    def test_empty_queue_waits_for_the_timeout(self):
+        started = time.monotonic()
+        self.assertEqual(Scheduler().wait_due(0.1), [])
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_returns_due_jobs_without_cancelled_ones(self):
+        scheduler = Scheduler()
+        due, cancelled = job("a"), job("b")
+        scheduler.add(due, time.monotonic())
+        scheduler.add(cancelled, time.monotonic())
+        cancelled.cancelled = True
+
+        self.assertEqual(scheduler.wait_due(1), [due])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import shared.config  # noqa: F401, resolves the import order of the resolver package
+from resolver.run_results import Result
+from shared import shm
+from shared.cache import ResultCache
+
+
+class RestartTest(unittest.TestCase):
+    def setUp(self):
+        self.memory = shm.create(1, 8, 1024)
+        self.addCleanup(self.memory.unlink)
+        self.addCleanup(self.memory.close)
+
+    def test_results_of_a_previous_process_are_removed(self):
+        published = ResultCache()
+        reader = shm.SharedResultReader(self.memory, published)
+
+        previous = shm.SharedResultCache(self.memory, 0)
+        previous.update("a", "network", Result(None, {"ping": 1.0}))
+        previous.update("b", "network", Result(None, {"ping": 2.0}))
+        reader.sync()
+        self.assertIsNotNone(published.get("b", "network"))
+
+        restarted = shm.SharedResultCache(self.memory, 0)
+        restarted.update("a", "network", Result(None, {"ping": 3.0}))
+        reader.sync()
+
+        self.assertIsNone(published.get("b", "network"))
+        self.assertEqual(published.get("a", "network").metrics, {"ping": 3.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
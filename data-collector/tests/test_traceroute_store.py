@@ -0,0 +1,29 @@
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import shared.config  # noqa: F401, resolves the import order of the resolver package
+from resolver.traceroute_store import TracerouteStore
+
+
+class CompactionTest(unittest.TestCase):
+    def test_route_change_within_a_slot_survives(self):
+        with tempfile.TemporaryDirectory() as path:
+            store = TracerouteStore(path, retention_days=None, compact_after_days=7, compact_interval=600)
+            slot = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+            store.append("host", slot, "route A")
+            store.append("host", slot + timedelta(seconds=30), "route B")
+
+            store._compact("host", "2025-06-01")
+
+            self.assertEqual(len(store.entries("host", "2025-06-01")), 1)
+            _, text = store.at("host", slot + timedelta(hours=1))
+            self.assertEqual(text, "route B")
+
+
+if __name__ == "__main__":
+    unittest.main()